@@ -1,13 +1,29 @@
-from flask import Flask, request, jsonify, render_template
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Flask, Response, g, request, jsonify, render_template
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.cluster import KMeans
-import shap
 import joblib
+import math
 import os
 import logging
+import time
+
+from artifacts import load_or_fit_reference
+from cohort_rollups import COHORT_DIMENSIONS, FEATURE_GROUPS, CohortRollups, connect_readonly, ensure_schema
+from cohort_rollups import risk_distribution, shap_attribution
+from cohort_stats import CohortStats
+from compiled_forest import CompiledForest, INFERENCE_BACKENDS
+from feature_encoder import CompiledFeatureEncoder
+from metrics import registry as metrics_registry, stage
+from features import input_number_columns, number_columns, word_columns
+from global_shap import GlobalExplanations
+from peer_index import PeerIndex
+from micro_batcher import MicroBatcher, QueueFullError
+from prediction_store import DB_PATH, IdAllocator, Observation, PredictionStore, connect as connect_db
+from response_cache import (CACHE_BACKENDS, MemoryCacheBackend, ResponseCache, SQLiteCacheBackend, model_version,
+                            student_key)
+from scenarios import MAX_SCENARIOS, STANDARD_SCENARIOS, ScenarioEngine, grid_scenarios, grid_size, validate_scenario
+from shap_explainer import SharedExplainer, EXPLAIN_DEPTHS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,8 +32,14 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 
+# Per-stage latency histograms and request counters served at /metrics
+# (METRICS=0 disables recording). Requests sent with the X-Debug-Timing
+# header get their stage breakdown back in a Server-Timing header.
+metrics_registry.enabled = os.environ.get("METRICS", "1") == "1"
+DEBUG_TIMING_HEADER = "X-Debug-Timing"
+
 # Check if model files exist
-MODEL_FILES = ["student_model.joblib", "scaler.joblib", "encoder.joblib", "student-combined-final.csv"]
+MODEL_FILES = ["student_model.joblib", "scaler.joblib", "encoder.joblib"]
 missing_files = [f for f in MODEL_FILES if not os.path.exists(f)]
 if missing_files:
     logger.error(f"Missing required model files: {missing_files}")
@@ -33,130 +55,393 @@ except Exception as e:
     logger.error(f"Error loading model files: {str(e)}")
     raise
 
-# Load original dataset for clustering and peer benchmarking
+# Optionally score through flat node tables instead of sklearn's predict_proba
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "sklearn")
+if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+    raise ValueError(f"INFERENCE_BACKEND must be one of {list(INFERENCE_BACKENDS)}")
+scorer = CompiledForest.from_sklearn(model) if INFERENCE_BACKEND == "compiled" else model
+logger.info(f"Using {INFERENCE_BACKEND} inference backend")
+
+# One SHAP explainer shared by every request. shap (with numba and scipy) is
+# imported when the first explained request builds it; EXPLAINER_WARMUP=1
+# builds it at startup instead, trading boot time for first-request latency
+explainer = SharedExplainer(model)
+if os.environ.get("EXPLAINER_WARMUP", "0") == "1":
+    explainer.get()
+    logger.info("Initialized SHAP TreeExplainer")
+
+DATA_PATH = "student-combined-final.csv"
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", "artifacts")
+
+# Load the prebuilt reference artifacts for peer benchmarking, falling back to
+# fitting them from the original dataset (run artifacts.py to build them)
 try:
-    data_path = "student-combined-final.csv"
-    data = pd.read_csv(data_path, sep=';')
-    logger.info("Successfully loaded dataset")
+    reference = load_or_fit_reference(ARTIFACTS_DIR, DATA_PATH, scaler, scaler_path="scaler.joblib",
+                                      verify=os.environ.get("VERIFY_ARTIFACTS") == "1")
 except Exception as e:
-    logger.error(f"Error loading dataset: {str(e)}")
+    logger.error(f"Error loading reference data: {str(e)}")
     raise
 
-# Define columns (same as training)
-number_columns = [
-    "age", "Medu", "Fedu", "traveltime", "studytime", "failures",
-    "famrel", "freetime", "goout", "Dalc", "Walc", "health", "absences",
-    "G1", "G2", "study_effort", "alcohol_index", "parents_education",
-    "grade_change", "high_absences"
-]
-word_columns = [
-    "school", "sex", "famsize", "Pstatus", "Mjob", "Fjob", "reason",
-    "guardian", "schoolsup", "famsup", "paid", "activities", "nursery",
-    "higher", "internet", "romantic"
-]
-
-def add_new_columns(data):
-    """Add engineered features to the dataset."""
-    if 'G3' in data.columns:
-        data["final_grade"] = (data["G1"] + data["G2"] + data["G3"]) / 3
-        data["final_grade"] = data["final_grade"].round(2)
+feature_names = number_columns + list(encoder.get_feature_names_out(word_columns))
+
+# SHAP values of every reference student, precomputed by global_shap.py, put
+# each student's feature-group attributions in context (percentiles overall
+# and within the peer group) and back /explanations/global
+try:
+    global_explanations = GlobalExplanations.load(ARTIFACTS_DIR, model_path="student_model.joblib",
+                                                  feature_names=feature_names)
+    logger.info(f"Loaded reference SHAP values for {global_explanations.manifest['n_rows']} students")
+except (FileNotFoundError, ValueError) as e:
+    logger.warning(f"Reference SHAP values unavailable ({e}); run global_shap.py for attribution percentiles")
+    global_explanations = None
+
+# Upper bound on records accepted by /predict/batch in one request
+MAX_BATCH_SIZE = 5000
+
+# Explanation depth used when a request does not ask for one; "full" adds
+# pairwise SHAP interactions, by far the most expensive step
+DEFAULT_EXPLAIN_DEPTH = "main"
+
+# Predictions are written to student_features.db by a background writer
+# thread so responses never wait on SQLite (PERSIST_PREDICTIONS=0 disables,
+# and prediction ids are then numbered in memory without touching the file)
+PERSIST_PREDICTIONS = os.environ.get("PERSIST_PREDICTIONS", "1") == "1"
+prediction_store = PredictionStore(DB_PATH) if PERSIST_PREDICTIONS else None
+prediction_ids = IdAllocator(DB_PATH if PERSIST_PREDICTIONS else None)
+
+# Peer group assignment: "centroid" (O(clusters) lookup) or "nearest_row"
+PEER_ASSIGNMENT = os.environ.get("PEER_ASSIGNMENT", "centroid")
+peer_index = PeerIndex.from_reference(reference, assignment=PEER_ASSIGNMENT)
+
+# Cache of full /predict responses. Keys include a hash of the model files and
+# reference artifacts, so replacing student_model.joblib invalidates old entries.
+# RESPONSE_CACHE=sqlite shares one cache file between worker processes.
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "memory")
+if RESPONSE_CACHE not in CACHE_BACKENDS:
+    raise ValueError(f"RESPONSE_CACHE must be one of {list(CACHE_BACKENDS)}")
+RESPONSE_CACHE_MB = float(os.environ.get("RESPONSE_CACHE_MB", "64"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+if RESPONSE_CACHE == "off":
+    response_cache = None
+else:
+    cache_bytes = int(RESPONSE_CACHE_MB * (1 << 20))
+    if RESPONSE_CACHE == "sqlite":
+        cache_backend = SQLiteCacheBackend(os.environ.get("RESPONSE_CACHE_PATH", "response_cache.db"),
+                                           cache_bytes, RESPONSE_CACHE_TTL)
     else:
-        data['final_grade'] = np.nan
-    data["alcohol_index"] = data["Dalc"] + data["Walc"]
-    data["parents_education"] = data["Medu"] + data["Fedu"]
-    data["grade_change"] = data["G2"] - data["G1"]
-    avg_absences = data["absences"].mean()
-    data["high_absences"] = data["absences"].apply(lambda x: 1 if x > avg_absences else 0)
-    data["study_effort"] = data["studytime"] * (5 - data["traveltime"])
-    return data
-
-# Add engineered features to original data before clustering
-data = add_new_columns(data)
-
-# Preprocess for clustering
-X_scaled = scaler.transform(data[number_columns])
-clusters = KMeans(n_clusters=3, random_state=42).fit_predict(X_scaled)
-data["cluster"] = clusters
-
-def process_user_data(user_input):
-    """Process user input, predict risk, and generate insights."""
-    # Convert user input to DataFrame
-    user_df = pd.DataFrame([user_input])
-    user_df = add_new_columns(user_df)
+        cache_backend = MemoryCacheBackend(cache_bytes, RESPONSE_CACHE_TTL)
+    shap_checksum = global_explanations.checksum if global_explanations is not None else None
+    response_cache = ResponseCache(cache_backend,
+                                   model_version(MODEL_FILES, [reference.checksum, PEER_ASSIGNMENT, shap_checksum]))
+    logger.info(f"Response cache: {RESPONSE_CACHE}, {RESPONSE_CACHE_MB:g} MB, model version {response_cache.version}")
+
+def validate_user_input(user_input):
+    """Return a list of validation errors for one student record (empty if valid)."""
+    if not isinstance(user_input, dict):
+        return ["Record must be a JSON object"]
+    errors = []
+    for col in input_number_columns:
+        value = user_input.get(col)
+        if value is None:
+            errors.append(f"Missing field: {col}")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors.append(f"Field {col} must be numeric")
+        elif not math.isfinite(value):
+            errors.append(f"Field {col} must be finite")
+    # G3 is optional (final_grade and the trajectory use it when given)
+    g3 = user_input.get("G3")
+    if g3 is not None and (isinstance(g3, bool) or not isinstance(g3, (int, float)) or not math.isfinite(g3)):
+        errors.append("Field G3 must be a finite number when given")
+    for col, categories in zip(word_columns, encoder.categories_):
+        value = user_input.get(col)
+        if value is None:
+            errors.append(f"Missing field: {col}")
+        elif value not in categories:
+            errors.append(f"Field {col} must be one of {list(categories)}")
+    return errors
+
+# Raw dicts -> model matrix with NumPy only, from the fitted scaler/encoder parameters
+feature_encoder = CompiledFeatureEncoder.from_fitted(scaler, encoder)
+
+# Running peer statistics: each newly seen student (repeat views count once)
+# updates its cluster's means/variances and the absence mean behind the
+# anomaly flags, on the prediction store's writer thread (COHORT_STATS=0
+# disables; centroid assignment only). COHORT_RECLUSTER_EVERY=n also moves the
+# centroids with a background MiniBatchKMeans after every n new students. The
+# model's own high_absences feature keeps the training-set mean.
+COHORT_STATS = os.environ.get("COHORT_STATS", "1") == "1" and PEER_ASSIGNMENT == "centroid"
+COHORT_RECLUSTER_EVERY = int(os.environ.get("COHORT_RECLUSTER_EVERY", "0"))
+
+def publish_peer_index(index, reclustered):
+    """Swap in updated peer groups; moved centroids also retire cached responses."""
+    global peer_index
+    peer_index = index
+    if reclustered and response_cache is not None:
+        response_cache.version = f"{response_cache.version.split('+')[0]}+r{cohort_stats.reclusters}"
+
+if COHORT_STATS:
+    cohort_stats = CohortStats(peer_index, reference,
+                               lambda records: feature_encoder.encode(records)[1][:, :len(number_columns)],
+                               publish_peer_index, COHORT_RECLUSTER_EVERY)
+    if prediction_store is not None:
+        prediction_store.listeners.append(cohort_stats.observe)
+else:
+    cohort_stats = None
+
+# Cohort analytics: every stored student is folded into rollup tables in
+# student_features.db (counts, risk histogram and SHAP group sums per school,
+# sex, Mjob and peer cluster) in the same transaction as its prediction row,
+# once per student however often it is viewed, so /cohorts/* reads a handful
+# of rows (COHORT_ROLLUPS=0 disables)
+COHORT_ROLLUPS = os.environ.get("COHORT_ROLLUPS", "1") == "1" and prediction_store is not None
+if COHORT_ROLLUPS:
+    rollup_conn = connect_db(DB_PATH)
+    with rollup_conn:
+        ensure_schema(rollup_conn)
+    rollup_conn.close()
+    prediction_store.rollup = CohortRollups(lambda records: feature_encoder.encode(records)[1], lambda: peer_index,
+                                            feature_names).apply
+
+def current_absence_mean():
+    """Absence mean of every student seen so far (reference data plus stored predictions)."""
+    return cohort_stats.absence_mean if cohort_stats is not None else reference.absence_mean
+
+def prepare_features(records):
+    """Engineer, scale and encode raw student dicts into the model's input matrix.
+
+    Returns ``(engineered, user_ready)``: the unscaled engineered numeric
+    columns and the model-ready matrix.
+    """
+    return feature_encoder.encode(records)
+
+def score_features(user_ready):
+    """Return risk probabilities and at_risk labels from a single predict_proba call."""
+    proba = scorer.predict_proba(user_ready)
+    risk_probs = proba[:, 1]  # Probability of at_risk = 1
+    # Same rule RandomForestClassifier.predict applies to these probabilities
+    at_risk = scorer.classes_[np.argmax(proba, axis=1)]
+    return risk_probs, at_risk
+
+# Evaluates every what-if scenario of a request in one model call
+scenario_engine = ScenarioEngine(feature_encoder.mean, feature_encoder.scale,
+                                 lambda user_ready: score_features(user_ready)[0], feature_encoder.absence_mean)
+
+def standard_what_ifs(engineered, user_ready):
+    """Risk under each of ``STANDARD_SCENARIOS`` for every row, one dict per row."""
+    probs = scenario_engine.evaluate(engineered, user_ready[:, len(number_columns):],
+                                     list(STANDARD_SCENARIOS.values()))
+    return [dict(zip(STANDARD_SCENARIOS, row)) for row in probs]
+
+def process_user_data(user_input, depth=DEFAULT_EXPLAIN_DEPTH, top_k=None):
+    """Process user input, predict risk, and generate insights.
+
+    ``depth`` is one of ``EXPLAIN_DEPTHS``; with ``top_k`` set, the full-depth
+    top interaction is only searched among the k strongest features.
+    """
+    return score_student(user_input, depth, top_k)[0]
+
+def score_student(user_input, depth=DEFAULT_EXPLAIN_DEPTH, top_k=None):
+    """``process_user_data`` returning ``(result, shap)``.
+
+    ``shap`` is the class-1 SHAP vector of the student, or None when the
+    request was not explained or was served from the response cache.
+    """
+    with stage("validate"):
+        errors = validate_user_input(user_input)
+    if errors:
+        raise ValueError("; ".join(errors))
+
+    # Repeat requests for the same student are served from the response cache
+    cache_key, cached = lookup_cached(user_input, depth, top_k)
+    if cached is not None:
+        return cached, None
     
     # Preprocess for model
-    user_numbers = scaler.transform(user_df[number_columns])
-    user_words = encoder.transform(user_df[word_columns])
-    user_ready = np.hstack((user_numbers, user_words))
+    with stage("encode"):
+        engineered, user_ready = prepare_features([user_input])
     
     # Predict with Random Forest
-    risk_prob = model.predict_proba(user_ready)[0][1]  # Probability of at_risk = 1
-    at_risk = model.predict(user_ready)[0]  # 0 or 1
+    with stage("predict"):
+        risk_probs, at_risk = score_features(user_ready)
     
     # SHAP analysis (explain risk probability, class 1)
-    explainer = shap.TreeExplainer(model)
-    shap_values = explainer.shap_values(user_ready)
-    if isinstance(shap_values, list) and len(shap_values) > 1:
-        shap_values_class = shap_values[1]  # Class 1 (risk)
+    with stage("explain"):
+        explanation = explainer.explain(user_ready, depth, top_k)[0]
+    with stage("what_if"):
+        what_ifs = standard_what_ifs(engineered, user_ready)[0]
+    with stage("insights"):
+        result = build_result(user_input, engineered[0], user_ready[0], risk_probs[0], at_risk[0], explanation, what_ifs)
+    if cache_key is not None:
+        with stage("cache_store"):
+            response_cache.put(cache_key, result)
+    return result, explanation["shap"]
+
+def lookup_cached(user_input, depth, top_k):
+    """Return ``(cache_key, cached_result)``; the result is None on a miss, both are None without a cache."""
+    if response_cache is None:
+        return None, None
+    with stage("cache_lookup"):
+        cache_key = response_cache.key(user_input, depth, top_k)
+        cached = response_cache.get(cache_key)
+    if cached is not None:
+        # Peer statistics and the absence mean move with every stored prediction;
+        # recompute the fields built from them instead of serving stale values
+        with stage("peers"):
+            peers = peer_index
+            user_cluster = peers.assign(prepare_features([user_input])[1][:, :len(number_columns)])[0]
+            insights = dict(cached["insights"], **live_insights(user_input, peers, user_cluster))
+        cached = dict(cached, insights=insights, student_id=prediction_ids.next_id())
+    return cache_key, cached
+
+def process_batch_data(records, depth=DEFAULT_EXPLAIN_DEPTH, top_k=None):
+    """Score a list of student records with one vectorized model call.
+
+    Returns one entry per record in input order: ``{"index", "result"}`` for
+    scored students or ``{"index", "errors"}`` for records that failed validation.
+    """
+    return score_batch(records, depth, top_k)[0]
+
+def score_batch(records, depth=DEFAULT_EXPLAIN_DEPTH, top_k=None):
+    """``process_batch_data`` returning ``(entries, shaps)``; ``shaps[i]`` is record i's SHAP vector or None."""
+    results = [None] * len(records)
+    shaps = [None] * len(records)
+    valid_idx = []
+    with stage("validate"):
+        for i, record in enumerate(records):
+            errors = validate_user_input(record)
+            if errors:
+                results[i] = {"index": i, "errors": errors}
+            else:
+                valid_idx.append(i)
+    if not valid_idx:
+        return results, shaps
+
+    metrics_registry.record_batch("batch", len(valid_idx))
+    with stage("encode"):
+        engineered, user_ready = prepare_features([records[i] for i in valid_idx])
+    with stage("predict"):
+        risk_probs, at_risk = score_features(user_ready)
+
+    with stage("explain"):
+        explanations = explainer.explain(user_ready, depth, top_k)
+    with stage("what_if"):
+        what_ifs = standard_what_ifs(engineered, user_ready)
+    with stage("insights"):
+        for row, i in enumerate(valid_idx):
+            result = build_result(records[i], engineered[row], user_ready[row], risk_probs[row], at_risk[row],
+                                  explanations[row], what_ifs[row])
+            results[i] = {"index": i, "result": result}
+            shaps[i] = explanations[row]["shap"]
+    return results, shaps
+
+def process_micro_batch(items):
+    """Score queued ``(user_input, depth, top_k)`` requests, one vectorized call per option set.
+
+    Returns one ``(entry, shap)`` pair per request, as ``score_batch`` produces them.
+    """
+    metrics_registry.record_batch("microbatch", len(items))
+    results = [None] * len(items)
+    groups = {}
+    for i, (_, depth, top_k) in enumerate(items):
+        groups.setdefault((depth, top_k), []).append(i)
+    for (depth, top_k), indices in groups.items():
+        entries, shaps = score_batch([items[i][0] for i in indices], depth, top_k)
+        for i, entry, shap_vector in zip(indices, entries, shaps):
+            results[i] = (entry, shap_vector)
+    return results
+
+# Production serving mode: /predict requests wait on a queue and a scheduler
+# thread scores them in micro-batches (SERVING_MODE=microbatch)
+SERVING_MODE = os.environ.get("SERVING_MODE", "sync")
+if SERVING_MODE not in ("sync", "microbatch"):
+    raise ValueError("SERVING_MODE must be 'sync' or 'microbatch'")
+MICRO_BATCH_SIZE = int(os.environ.get("MICRO_BATCH_SIZE", "64"))
+MICRO_BATCH_WAIT_MS = float(os.environ.get("MICRO_BATCH_WAIT_MS", "5"))
+MICRO_BATCH_QUEUE = int(os.environ.get("MICRO_BATCH_QUEUE", "1024"))
+MICRO_BATCH_TIMEOUT = float(os.environ.get("MICRO_BATCH_TIMEOUT", "30"))
+if SERVING_MODE == "microbatch":
+    micro_batcher = MicroBatcher(process_micro_batch, MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS, MICRO_BATCH_QUEUE)
+    logger.info(f"Micro-batching /predict: up to {MICRO_BATCH_SIZE} requests or {MICRO_BATCH_WAIT_MS:g} ms")
+else:
+    micro_batcher = None
+
+def process_queued(user_input, depth=DEFAULT_EXPLAIN_DEPTH, top_k=None):
+    """``score_student`` through the micro-batch queue.
+
+    Raises ValueError for invalid input, QueueFullError when the queue is at
+    capacity and concurrent.futures.TimeoutError if no result arrives in time.
+    """
+    errors = validate_user_input(user_input)
+    if errors:
+        raise ValueError("; ".join(errors))
+    cache_key, cached = lookup_cached(user_input, depth, top_k)
+    if cached is not None:
+        return cached, None
+    with stage("micro_batch_wait"):
+        entry, shap_vector = micro_batcher.submit((user_input, depth, top_k)).result(timeout=MICRO_BATCH_TIMEOUT)
+    if "errors" in entry:
+        raise ValueError("; ".join(entry["errors"]))
+    if cache_key is not None:
+        response_cache.put(cache_key, entry["result"])
+    return entry["result"], shap_vector
+
+def live_insights(user_input, peers, user_cluster):
+    """Insights that depend on the running cohort statistics, which change with every stored prediction."""
+    peer_avg = peers.peer_means(user_cluster, ["studytime", "absences", "G1"])
+    anomalies = []
+    if user_input["G1"] > 12 and user_input["absences"] > current_absence_mean():
+        anomalies.append("High grades but rising absences")
+    return {
+        "peer_benchmark": {
+            "studytime": f"Yours: {user_input['studytime']} vs. Peer Avg: {peer_avg['studytime']:.1f}",
+            "absences": f"Yours: {user_input['absences']} vs. Peer Avg: {peer_avg['absences']:.1f}",
+            "G1": f"Yours: {user_input['G1']} vs. Peer Avg: {peer_avg['G1']:.1f}"
+        },
+        "anomalies": anomalies if anomalies else ["No unusual patterns"],
+    }
+
+def build_result(user_input, engineered, user_ready, risk_prob, at_risk, explanation, what_ifs):
+    """Generate insights for one scored student.
+
+    ``engineered`` and ``user_ready`` are the student's rows from
+    ``prepare_features``; ``what_ifs`` maps each ``STANDARD_SCENARIOS`` label
+    to the risk under that scenario.
+    """
+    engineered = dict(zip(number_columns, engineered))
+    shap_values_class = explanation["shap"]
+    if shap_values_class is None:
+        shap_contributions = {}
     else:
-        shap_values_class = shap_values[0] if isinstance(shap_values, list) else shap_values
-    
-    feature_names = number_columns + list(encoder.get_feature_names_out(word_columns))
-    shap_values_class = np.ravel(shap_values_class)  # Ensure 1D array of scalars
-    shap_contributions = {k: float(v) for k, v in zip(feature_names, shap_values_class)}
+        shap_contributions = {k: float(v) for k, v in zip(feature_names, shap_values_class)}
     
     # Generate insights
     insights = {}
     base_threshold = 0.5
-    threshold_adjust = 0.1 * (user_df["parents_education"].iloc[0] / 8)
+    threshold_adjust = 0.1 * (engineered["parents_education"] / 8)
     dynamic_threshold = min(base_threshold + threshold_adjust, 1.0)
     risk_label = "High" if risk_prob > dynamic_threshold else "Low" if risk_prob < 0.3 else "Medium"
     insights["dynamic_risk"] = {"probability": f"{risk_prob:.2f}", "label": risk_label, "threshold": f"{dynamic_threshold:.2f}"}
     
-    # Feature interaction insights
-    shap_interactions = explainer.shap_interaction_values(user_ready)
-    if isinstance(shap_interactions, list) and len(shap_interactions) > 1:
-        shap_interactions_class = shap_interactions[1]
-    else:
-        shap_interactions_class = shap_interactions[0] if isinstance(shap_interactions, list) else shap_interactions
-    
-    if shap_interactions_class.ndim == 2 and shap_interactions_class.shape[0] > 1:
-        top_interaction_idx = np.argmax(np.abs(shap_interactions_class))
-        feature1, feature2 = np.unravel_index(top_interaction_idx, shap_interactions_class.shape)
-        interaction_value = float(shap_interactions_class[feature1, feature2])
+    # Feature interaction insights (only computed for explain=full)
+    if explanation["interaction"] is not None:
+        feature1, feature2, interaction_value = explanation["interaction"]
         insights["top_interaction"] = f"{feature_names[feature1]} + {feature_names[feature2]}: {interaction_value:.2f}"
+        # Exact SHAP interaction values; top_k only narrows which pairs are compared
+        top_k = explanation.get("interaction_top_k")
+        insights["top_interaction_scope"] = f"top_{top_k}_features" if top_k else "all_features"
     else:
-        insights["top_interaction"] = "No significant interactions detected"
+        insights["top_interaction"] = "Deferred: request explain=full to compute interactions"
     
-    # Peer benchmarking
-    user_cluster = clusters[np.argmin(np.sum((X_scaled - user_numbers)**2, axis=1))]
-    peer_avg = data[data["cluster"] == user_cluster][["studytime", "absences", "G1"]].mean()
-    if peer_avg.isna().any():  # Handle empty cluster
-        peer_avg = pd.Series({"studytime": 0, "absences": 0, "G1": 0})
-    insights["peer_benchmark"] = {
-        "studytime": f"Yours: {user_df['studytime'].iloc[0]} vs. Peer Avg: {peer_avg['studytime']:.1f}",
-        "absences": f"Yours: {user_df['absences'].iloc[0]} vs. Peer Avg: {peer_avg['absences']:.1f}",
-        "G1": f"Yours: {user_df['G1'].iloc[0]} vs. Peer Avg: {peer_avg['G1']:.1f}"
-    }
+    # Peer benchmarking (and the anomaly flags, see live_insights)
+    with stage("peers"):
+        peers = peer_index
+        user_cluster = peers.assign(user_ready[:len(number_columns)])[0]
+        live = live_insights(user_input, peers, user_cluster)
+    insights["peer_benchmark"] = live["peer_benchmark"]
     
     # Predictive "What-If" Scenarios
-    def what_if(user_df, feature, new_value):
-        mod_df = user_df.copy()
-        mod_df[feature] = new_value
-        if feature in ["studytime", "traveltime"]:
-            mod_df["study_effort"] = mod_df["studytime"] * (5 - mod_df["traveltime"])
-        elif feature == "absences":
-            avg_absences = data["absences"].mean()
-            mod_df["high_absences"] = mod_df["absences"].apply(lambda x: 1 if x > avg_absences else 0)
-        elif feature in ["Dalc", "Walc"]:
-            mod_df["alcohol_index"] = mod_df["Dalc"] + mod_df["Walc"]
-        mod_numbers = scaler.transform(mod_df[number_columns])
-        mod_words = encoder.transform(mod_df[word_columns])
-        mod_ready = np.hstack((mod_numbers, mod_words))
-        return model.predict_proba(mod_ready)[0][1]
-    
-    what_if_study = what_if(user_df, "studytime", user_df["studytime"].iloc[0] + 1)
-    what_if_absences = what_if(user_df, "absences", max(0, user_df["absences"].iloc[0] - 5))
+    what_if_study = what_ifs["study_plus_1"]
+    what_if_absences = what_ifs["absences_minus_5"]
     insights["what_if"] = {
         "current": f"{risk_prob:.2f}",
         "study_plus_1": f"{what_if_study:.2f}",
@@ -164,35 +449,36 @@ def process_user_data(user_input):
     }
     
     # Temporal Grade Trajectory
-    trajectory = [float(user_df["G1"].iloc[0]), float(user_df["G2"].iloc[0])]
-    if "G3" in user_df and not pd.isna(user_df["G3"].iloc[0]):
-        trajectory.append(float(user_df["G3"].iloc[0]))
+    g3 = user_input.get("G3")
+    has_g3 = g3 is not None and not pd.isna(g3)
+    trajectory = [float(user_input["G1"]), float(user_input["G2"])]
+    if has_g3:
+        trajectory.append(float(g3))
     else:
         diff = trajectory[-1] - trajectory[-2]
         trajectory.append(trajectory[-1] + diff if diff != 0 else trajectory[-1])
     insights["trajectory"] = trajectory
     
     # Behavioral Risk Profiles
-    categories = {
-        "Academic Effort": ["studytime", "failures", "study_effort"],
-        "Lifestyle": ["Dalc", "Walc", "goout", "alcohol_index"],
-        "Support": ["famrel", "parents_education"]
-    }
     risk_profile = {}
     total_shap = np.sum([abs(v) for v in shap_contributions.values()]) or 1
-    for category, feats in categories.items():
+    for category, feats in FEATURE_GROUPS.items():
         contrib = sum(shap_contributions.get(feat, 0) for feat in feats)
         risk_profile[category] = (contrib / total_shap) * risk_prob * 100 if total_shap > 0 else 0
     insights["risk_profile"] = {k: f"{v:.1f}%" for k, v in risk_profile.items()}
+    if shap_values_class is None:
+        insights["risk_profile"] = {k: "Deferred" for k in FEATURE_GROUPS}
+    elif global_explanations is not None:
+        insights["attribution_percentile"] = global_explanations.percentiles(shap_values_class, user_cluster)
     
     # Intervention Impact Scores
     interventions = [
-        ("studytime", user_df["studytime"].iloc[0] + 1, "Study +1 hr"),
-        ("absences", max(0, user_df["absences"].iloc[0] - 5), "Attend 5 more classes")
+        ("study_plus_1", "Study +1 hr"),
+        ("absences_minus_5", "Attend 5 more classes")
     ]
     impact_scores = []
-    for feat, new_val, label in interventions:
-        new_risk = what_if(user_df, feat, new_val)
+    for scenario, label in interventions:
+        new_risk = what_ifs[scenario]
         impact = risk_prob - new_risk
         if impact > 0.01:
             impact_scores.append(f"{label}: -{impact:.2f}")
@@ -201,6 +487,8 @@ def process_user_data(user_input):
     # Resilience Indicators
     resilience = {k: v for k, v in shap_contributions.items() if v < 0 and k in ["famrel", "parents_education", "schoolsup"]}
     insights["resilience"] = [f"{k}: {-v:.2f}" for k, v in resilience.items()] if resilience else ["No major resilience factors"]
+    if shap_values_class is None:
+        insights["resilience"] = ["Deferred"]
     
     # Subject-Specific Risk (Placeholder)
     insights["subject_risk"] = {
@@ -209,22 +497,49 @@ def process_user_data(user_input):
     }
     
     # Anomaly Detection Flags
-    anomalies = []
-    if user_df["G1"].iloc[0] > 12 and user_df["absences"].iloc[0] > data["absences"].mean():
-        anomalies.append("High grades but rising absences")
-    insights["anomalies"] = anomalies if anomalies else ["No unusual patterns"]
+    insights["anomalies"] = live["anomalies"]
     
     # Compile Final Output
     result = {
-        "student_id": int(pd.Timestamp.now().timestamp()),
+        "student_id": prediction_ids.next_id(),
         "risk_probability": float(risk_prob),
         "at_risk": int(at_risk),
-        "final_grade": float(user_df["final_grade"].iloc[0]) if "G3" in user_df and not pd.isna(user_df["final_grade"].iloc[0]) else None,
-        "alcohol_index": int(user_df["alcohol_index"].iloc[0]),
+        # np.round matches the pandas rounding add_new_columns applies
+        "final_grade": float(np.round((user_input["G1"] + user_input["G2"] + g3) / 3, 2)) if has_g3 else None,
+        "alcohol_index": int(engineered["alcohol_index"]),
         "insights": insights
     }
     return result
 
+def explain_options(args):
+    """Read the ``explain`` depth and ``top_k`` query parameters of a request."""
+    depth = args.get("explain", DEFAULT_EXPLAIN_DEPTH)
+    if depth not in EXPLAIN_DEPTHS:
+        raise ValueError(f"explain must be one of {list(EXPLAIN_DEPTHS)}")
+    top_k = args.get("top_k", type=int)
+    if top_k is not None and top_k < 2:
+        raise ValueError("top_k must be at least 2")
+    return depth, top_k
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if request.headers.get(DEBUG_TIMING_HEADER):
+        metrics_registry.start_breakdown()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    metrics_registry.record_request(request.endpoint or "unknown", response.status_code, elapsed)
+    if request.headers.get(DEBUG_TIMING_HEADER):
+        totals = {}
+        for name, seconds in metrics_registry.finish_breakdown():
+            totals[name] = totals.get(name, 0.0) + seconds
+        totals["total"] = elapsed
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.3f}"
+                                                      for name, seconds in totals.items())
+    return response
+
 @app.route('/')
 def home():
     """Root route that returns a simple welcome message"""
@@ -238,13 +553,166 @@ def predict():
         if not user_input:
             return jsonify({"error": "No input data provided"}), 400
             
-        # Process the user input
-        result = process_user_data(user_input)
+        # Process the user input at the requested explanation depth
+        depth, top_k = explain_options(request.args)
+        if micro_batcher is not None:
+            result, shap_vector = process_queued(user_input, depth, top_k)
+        else:
+            result, shap_vector = score_student(user_input, depth, top_k)
+        if prediction_store is not None:
+            prediction_store.submit(result, Observation(student_key(user_input), user_input, result, shap_vector))
         # Return the result as JSON
         return jsonify(result), 200
+    except (QueueFullError, FutureTimeoutError) as e:
+        logger.warning(f"Rejecting request under load: {str(e) or 'timed out waiting for a batch'}")
+        return jsonify({"error": "Server busy, retry shortly"}), 503, {"Retry-After": "1"}
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        # Accept either a bare list of students or {"students": [...]}
+        payload = request.json
+        records = payload.get("students") if isinstance(payload, dict) else payload
+        if not isinstance(records, list) or not records:
+            return jsonify({"error": "Expected a non-empty list of students"}), 400
+        if len(records) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch size exceeds limit of {MAX_BATCH_SIZE}"}), 413
+
+        depth, top_k = explain_options(request.args)
+        results, shaps = score_batch(records, depth, top_k)
+        if prediction_store is not None:
+            for entry in results:
+                if "result" in entry:
+                    record = records[entry["index"]]
+                    prediction_store.submit(entry["result"], Observation(student_key(record), record, entry["result"],
+                                                                         shaps[entry["index"]]))
+        failed = sum(1 for r in results if "errors" in r)
+        return jsonify({"count": len(results), "failed": failed, "results": results}), 200
+    except Exception as e:
+        logger.error(f"Error processing batch request: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/predict/scenarios', methods=['POST'])
+def predict_scenarios():
+    """Risk for one student under a list of scenarios and/or a grid of values.
+
+    Body: ``{"student": {...}, "scenarios": [{feature: value | {"delta": k}}],
+    "grid": {feature: [values...]}}``; all scenarios are scored in one model call.
+    """
+    try:
+        payload = request.json or {}
+        user_input = payload.get("student")
+        errors = validate_user_input(user_input)
+        if errors:
+            return jsonify({"error": "Invalid student", "errors": errors}), 400
+        scenarios = list(payload.get("scenarios", []))
+        grid = payload.get("grid")
+        n_grid = grid_size(grid) if grid else 0
+        # Refuse oversized grids before expanding them
+        if len(scenarios) + n_grid > MAX_SCENARIOS:
+            return jsonify({"error": f"Scenario count exceeds limit of {MAX_SCENARIOS}"}), 413
+        if grid:
+            scenarios += grid_scenarios(grid)
+        if not scenarios:
+            return jsonify({"error": "Provide scenarios or a grid"}), 400
+        for changes in scenarios:
+            validate_scenario(changes)
+
+        engineered, user_ready = prepare_features([user_input])
+        risk_probs, _ = score_features(user_ready)
+        probs = scenario_engine.evaluate(engineered, user_ready[:, len(number_columns):], scenarios)[0]
+        return jsonify({
+            "risk_probability": float(risk_probs[0]),
+            "scenarios": [{"changes": changes, "risk_probability": float(p)} for changes, p in zip(scenarios, probs)]
+        }), 200
+    except Exception as e:
+        logger.error(f"Error processing scenario request: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """Return the response cache counters of this worker process."""
+    if response_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(response_cache.stats(), enabled=True, backend=RESPONSE_CACHE)), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this worker process's metrics."""
+    extra = []
+    if response_cache is not None:
+        extra += [
+            ("response_cache_hits_total", "counter", "Response cache hits", {(): response_cache.hits}),
+            ("response_cache_misses_total", "counter", "Response cache misses", {(): response_cache.misses}),
+            ("response_cache_evictions_total", "counter", "Response cache evictions",
+             {(): response_cache.backend.evictions}),
+        ]
+    if prediction_store is not None:
+        extra += [
+            ("predictions_written_total", "counter", "Predictions written to SQLite", {(): prediction_store.written}),
+            ("predictions_dropped_total", "counter", "Predictions dropped on a full queue",
+             {(): prediction_store.dropped}),
+            ("predictions_duplicate_total", "counter", "Predictions rejected for a duplicate id",
+             {(): prediction_store.duplicates}),
+        ]
+    if micro_batcher is not None:
+        extra += [
+            ("micro_batch_rejected_total", "counter", "Requests rejected with 503", {(): micro_batcher.rejected}),
+            ("micro_batch_queued", "gauge", "Requests waiting for a batch", {(): micro_batcher.stats()["queued"]}),
+        ]
+    return Response(metrics_registry.render(extra), mimetype="text/plain; version=0.0.4")
+
+@app.route('/explanations/global', methods=['GET'])
+def global_importances():
+    """Reference-wide feature importances (mean absolute SHAP value); ``?top=n`` limits the features."""
+    if global_explanations is None:
+        return jsonify({"error": "Reference SHAP values not built; run global_shap.py"}), 404
+    top = request.args.get("top", type=int)
+    return jsonify(global_explanations.importances(top)), 200
+
+@app.route('/peers', methods=['GET'])
+def peers():
+    """Return the precomputed statistics of every peer group."""
+    peers = peer_index
+    stats = peers.stats.reset_index().rename(columns={"index": "cluster"})
+    payload = {"assignment": peers.assignment, "clusters": stats.to_dict(orient="records")}
+    if cohort_stats is not None:
+        payload["cohort"] = cohort_stats.info()
+    return jsonify(payload), 200
+
+def cohort_query(query_fn):
+    """Run a rollup query for the ``by``/``value`` request arguments."""
+    if not COHORT_ROLLUPS:
+        return jsonify({"enabled": False}), 200
+    by = request.args.get("by", "all")
+    if by not in COHORT_DIMENSIONS:
+        return jsonify({"error": f"by must be one of {list(COHORT_DIMENSIONS)}"}), 400
+    conn = connect_readonly(DB_PATH)
+    try:
+        cohorts = query_fn(conn, by, request.args.get("value"))
+    finally:
+        conn.close()
+    return jsonify({"by": by, "cohorts": cohorts}), 200
+
+@app.route('/cohorts/risk', methods=['GET'])
+def cohort_risk():
+    """Student and at-risk counts, mean risk and risk histogram per cohort.
+
+    ``?by=school|sex|Mjob|cluster`` picks the grouping and ``&value=`` one cohort.
+    """
+    return cohort_query(risk_distribution)
+
+@app.route('/cohorts/attribution', methods=['GET'])
+def cohort_attribution():
+    """Mean SHAP attribution per feature group for each cohort (``by``/``value`` as /cohorts/risk)."""
+    return cohort_query(shap_attribution)
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # The debug reloader would start a second scheduler thread; serve threaded without it
+    if SERVING_MODE == "microbatch":
+        app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
+    else:
+        app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
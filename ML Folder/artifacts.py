@@ -0,0 +1,199 @@
+"""Offline build and memory-mapped loading of the reference artifacts.
+
+The service needs the scaled reference matrix, KMeans labels and centroids,
+the peer statistics table and the reference absence mean. Building them
+means parsing the CSV and fitting KMeans, so this is done once:
+
+    python artifacts.py --data student-combined-final.csv --out artifacts
+
+Arrays are stored as uncompressed ``.npy`` files and opened with
+``mmap_mode="r"``, so every worker process shares the same page-cache copy.
+Given ``--model`` and ``--encoder``, the build also exports the compiled
+forest and encoder parameters that ``scoring.py`` loads with NumPy only.
+pandas and joblib are imported only by the functions that need them.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from features import add_new_columns, number_columns, training_absence_mean
+from peer_index import cluster_statistics
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+ARRAY_FILES = {
+    "X_scaled": "reference_matrix.npy",
+    "labels": "cluster_labels.npy",
+    "centroids": "centroids.npy",
+    "peer_stats": "peer_stats.npy",
+}
+# Scoring exports: compiled forest node tables and encoder parameters
+FOREST_DIR = "forest"
+ENCODER_FILE = "encoder.json"
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ReferenceArtifacts:
+    """Reference data the service needs at runtime, fitted or loaded from disk."""
+
+    def __init__(self, X_scaled, labels, centroids, stats, absence_mean, manifest=None):
+        self.X_scaled = X_scaled
+        self.labels = labels
+        self.centroids = centroids
+        self.stats = stats
+        self.absence_mean = float(absence_mean)
+        self.manifest = manifest or {}
+
+    @property
+    def checksum(self):
+        """Combined checksum recorded when the artifacts were built (None if fitted in memory)."""
+        return self.manifest.get("checksum")
+
+
+def fit_reference(data, scaler, n_clusters=3, random_state=42):
+    """Engineer, scale and cluster a raw reference DataFrame in memory."""
+    from sklearn.cluster import KMeans
+
+    absence_mean = data["absences"].mean()
+    # Reference rows are encoded like scored students, with the model's training cut-off
+    data = add_new_columns(data, training_absence_mean(scaler))
+    X_scaled = scaler.transform(data[number_columns])
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state).fit(X_scaled)
+    stats = cluster_statistics(data, kmeans.labels_, n_clusters)
+    return ReferenceArtifacts(X_scaled, kmeans.labels_, kmeans.cluster_centers_, stats, absence_mean)
+
+
+def save_artifacts(reference, out_dir, source_files=()):
+    """Write the arrays and a manifest with per-file and combined checksums."""
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {
+        "X_scaled": np.ascontiguousarray(reference.X_scaled, dtype=np.float64),
+        "labels": np.asarray(reference.labels, dtype=np.int32),
+        "centroids": np.asarray(reference.centroids, dtype=np.float64),
+        "peer_stats": reference.stats.to_numpy(dtype=np.float64),
+    }
+    files = {}
+    for key, name in ARRAY_FILES.items():
+        path = os.path.join(out_dir, name)
+        np.save(path, arrays[key])
+        files[name] = file_sha256(path)
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_rows": int(arrays["X_scaled"].shape[0]),
+        "n_clusters": int(arrays["centroids"].shape[0]),
+        "absence_mean": reference.absence_mean,
+        "peer_stats_columns": list(reference.stats.columns),
+        "files": files,
+        "sources": {os.path.basename(p): file_sha256(p) for p in source_files},
+        "checksum": hashlib.sha256("".join(files[n] for n in sorted(files)).encode()).hexdigest(),
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    reference.manifest = manifest
+    return manifest
+
+
+def load_artifacts(out_dir, verify=False, scaler_path=None, data_path=None):
+    """Memory-map previously built artifacts.
+
+    Raises FileNotFoundError when no manifest exists and ValueError when the
+    format is unknown, a checksum does not match (with ``verify``), or the
+    artifacts were built from a different scaler than ``scaler_path`` or a
+    different reference CSV than ``data_path`` (when that file exists).
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No artifact manifest at {manifest_path}")
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version: {manifest.get('format_version')}")
+    for source_path in (scaler_path, data_path):
+        if source_path is None or not os.path.exists(source_path):
+            continue
+        expected = manifest.get("sources", {}).get(os.path.basename(source_path))
+        if expected is not None and expected != file_sha256(source_path):
+            raise ValueError(f"Artifacts in {out_dir} were built with a different {os.path.basename(source_path)}")
+
+    arrays = {}
+    for key, name in ARRAY_FILES.items():
+        path = os.path.join(out_dir, name)
+        if verify and file_sha256(path) != manifest["files"][name]:
+            raise ValueError(f"Checksum mismatch for {path}")
+        arrays[key] = np.load(path, mmap_mode="r")
+
+    import pandas as pd
+
+    stats = pd.DataFrame(np.asarray(arrays["peer_stats"]), columns=manifest["peer_stats_columns"])
+    return ReferenceArtifacts(arrays["X_scaled"], arrays["labels"], arrays["centroids"],
+                              stats, manifest["absence_mean"], manifest)
+
+
+def load_or_fit_reference(out_dir, data_path, scaler, scaler_path=None, verify=False):
+    """Load prebuilt artifacts, falling back to fitting them from the reference CSV."""
+    try:
+        reference = load_artifacts(out_dir, verify=verify, scaler_path=scaler_path, data_path=data_path)
+        logger.info(f"Loaded reference artifacts v{reference.manifest['format_version']} "
+                    f"({reference.manifest['n_rows']} rows, checksum {reference.checksum[:12]})")
+        return reference
+    except (FileNotFoundError, ValueError) as e:
+        logger.warning(f"Reference artifacts unavailable ({e}); fitting from {data_path}")
+    import pandas as pd
+
+    return fit_reference(pd.read_csv(data_path, sep=';'), scaler)
+
+
+def export_scoring_artifacts(model, scaler, encoder, out_dir, model_path=None):
+    """Write the compiled forest and encoder parameters used by ``scoring.Scorer``."""
+    from compiled_forest import CompiledForest
+    from feature_encoder import CompiledFeatureEncoder
+
+    CompiledForest.from_sklearn(model).save(os.path.join(out_dir, FOREST_DIR), model_path=model_path)
+    CompiledFeatureEncoder.from_fitted(scaler, encoder).save(os.path.join(out_dir, ENCODER_FILE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the reference artifacts used by the prediction service.")
+    parser.add_argument("--data", default="student-combined-final.csv", help="semicolon-separated reference CSV")
+    parser.add_argument("--scaler", default="scaler.joblib", help="fitted StandardScaler")
+    parser.add_argument("--out", default="artifacts", help="output directory")
+    parser.add_argument("--clusters", type=int, default=3, help="number of KMeans peer groups")
+    parser.add_argument("--model", default="student_model.joblib", help="fitted forest to export ('' to skip)")
+    parser.add_argument("--encoder", default="encoder.joblib", help="fitted OneHotEncoder to export")
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+
+    start = time.perf_counter()
+    data = pd.read_csv(args.data, sep=';')
+    scaler = joblib.load(args.scaler)
+    reference = fit_reference(data, scaler, n_clusters=args.clusters)
+    manifest = save_artifacts(reference, args.out, source_files=[args.data, args.scaler])
+    print(f"Built {manifest['n_rows']} reference rows into {args.out} "
+          f"in {time.perf_counter() - start:.2f}s (checksum {manifest['checksum'][:12]})")
+    if args.model:
+        export_scoring_artifacts(joblib.load(args.model), scaler, joblib.load(args.encoder), args.out,
+                                 model_path=args.model)
+        print(f"Exported compiled forest and encoder parameters to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Score large student extracts in fixed-size chunks.
+
+Reads a semicolon-separated CSV (like student-combined-final.csv) or a
+Parquet file chunk by chunk, scores each chunk with one vectorized
+encode + predict_proba pass, and streams the results to a CSV/JSON Lines
+file and/or student_features.db. Memory use is bounded by the chunk size.
+
+    python batch_score.py district.csv --output scores.csv --chunk-size 20000
+    python batch_score.py district.parquet --db student_features.db --offset 400000
+
+``--offset`` skips that many input rows and appends to existing outputs, so
+an interrupted run resumes from the last offset it reported.
+
+``--workers N`` scores (and with ``--explain``, explains) chunks in N
+processes. Results are written in input order. The reference matrix is
+written to ``--artifacts`` once and memory-mapped read-only by every worker.
+Only ``--backend compiled`` shares the forest the same way; with the default
+``--backend sklearn`` (and with ``--explain`` on either backend) every worker
+loads its own copy of the model. Scaling with the number of cores has not
+been measured for the reference workload (only 1-CPU hosts so far, where
+extra workers show nothing); measure it on the target host with
+
+    python benchmarks/bench_parallel.py --rows 200000 --max-workers 8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from artifacts import FOREST_DIR, load_or_fit_reference, save_artifacts
+from compiled_forest import CompiledForest, INFERENCE_BACKENDS
+from feature_encoder import CompiledFeatureEncoder
+from features import input_number_columns, number_columns, word_columns
+from peer_index import PeerIndex
+from prediction_store import IdAllocator, save_predictions
+from shap_explainer import EXPLAIN_DEPTHS, SharedExplainer, top_interaction_pair
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10000
+MODEL_PATH = "student_model.joblib"
+SCALER_PATH = "scaler.joblib"
+DATA_PATH = "student-combined-final.csv"
+
+# Number of SHAP features listed per row in the top_factors column
+TOP_FACTORS = 3
+
+# Chunks in flight per worker; bounds parent memory while keeping workers busy
+CHUNKS_PER_WORKER = 2
+
+
+def read_chunks(path, chunk_size, offset=0):
+    """Yield DataFrames of at most ``chunk_size`` rows, skipping the first ``offset`` rows."""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet requires pyarrow (pip install pyarrow)")
+        skipped = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            if skipped + batch.num_rows <= offset:
+                skipped += batch.num_rows
+                continue
+            frame = batch.to_pandas()
+            yield frame.iloc[max(0, offset - skipped):]
+            skipped += batch.num_rows
+    else:
+        yield from pd.read_csv(path, sep=';', chunksize=chunk_size, skiprows=range(1, offset + 1))
+
+
+def prepare_shared_artifacts(backend="sklearn", artifacts_dir="artifacts", data_path=DATA_PATH):
+    """Make sure the files workers memory-map exist before a parallel run."""
+    scaler = joblib.load(SCALER_PATH)
+    reference = load_or_fit_reference(artifacts_dir, data_path, scaler, scaler_path=SCALER_PATH)
+    if reference.checksum is None:
+        save_artifacts(reference, artifacts_dir, source_files=[data_path, SCALER_PATH])
+        logger.info(f"Saved reference artifacts to {artifacts_dir} for the workers")
+    if backend == "compiled":
+        forest_dir = os.path.join(artifacts_dir, FOREST_DIR)
+        try:
+            CompiledForest.load(forest_dir, model_path=MODEL_PATH)
+        except (FileNotFoundError, ValueError):
+            CompiledForest.from_sklearn(joblib.load(MODEL_PATH)).save(forest_dir, model_path=MODEL_PATH)
+            logger.info(f"Saved compiled forest to {forest_dir} for the workers")
+
+
+class ChunkScorer:
+    """Model, encoder and peer groups needed to score DataFrame chunks.
+
+    With the compiled backend the forest is memory-mapped from
+    ``<artifacts_dir>/forest`` when it was saved there, and the sklearn model
+    is only loaded if SHAP explanations are requested.
+    """
+
+    def __init__(self, backend="sklearn", artifacts_dir="artifacts", data_path=DATA_PATH, explain="none"):
+        scaler = joblib.load(SCALER_PATH)
+        encoder = joblib.load("encoder.joblib")
+        self.reference = load_or_fit_reference(artifacts_dir, data_path, scaler, scaler_path=SCALER_PATH)
+        self.feature_encoder = CompiledFeatureEncoder.from_fitted(scaler, encoder)
+        self.peer_index = PeerIndex.from_reference(self.reference)
+        self.feature_names = number_columns + list(encoder.get_feature_names_out(word_columns))
+        self.explain = explain
+
+        model = joblib.load(MODEL_PATH) if backend == "sklearn" or explain != "none" else None
+        if backend == "compiled":
+            try:
+                self.scorer = CompiledForest.load(os.path.join(artifacts_dir, FOREST_DIR), model_path=MODEL_PATH)
+            except (FileNotFoundError, ValueError):
+                self.scorer = CompiledForest.from_sklearn(model if model is not None else joblib.load(MODEL_PATH))
+        else:
+            self.scorer = model
+        # Batch rows rarely repeat, so skip the explanation cache
+        self.explainer = SharedExplainer(model, cache_size=0) if explain != "none" else None
+
+    def invalid_rows(self, chunk):
+        """Per-row validation message ('' when valid) for a raw chunk."""
+        errors = pd.Series("", index=chunk.index)
+        missing = [c for c in input_number_columns + word_columns if c not in chunk.columns]
+        if missing:
+            return errors + f"Missing columns: {missing}"
+        for col in input_number_columns:
+            bad = pd.to_numeric(chunk[col], errors="coerce").isna()
+            errors.loc[bad] += f"Field {col} must be numeric; "
+        for col, vocabulary in zip(word_columns, self.feature_encoder.vocabularies):
+            bad = ~chunk[col].isin(list(vocabulary))
+            errors.loc[bad] += f"Unknown {col}; "
+        return errors.str.rstrip("; ")
+
+    def score(self, chunk, start_row):
+        """Score one chunk; returns an output DataFrame aligned with its rows."""
+        errors = self.invalid_rows(chunk)
+        valid = (errors == "").to_numpy()
+        out = pd.DataFrame({"row": np.arange(start_row, start_row + len(chunk))})
+        # Filled in by the caller, which owns the id allocator of the output database
+        out["student_id"] = pd.array([pd.NA] * len(chunk), dtype="Int64")
+        out["risk_probability"] = np.nan
+        out["at_risk"] = pd.array([pd.NA] * len(chunk), dtype="Int64")
+        out["peer_cluster"] = pd.array([pd.NA] * len(chunk), dtype="Int64")
+        out["alcohol_index"] = pd.array([pd.NA] * len(chunk), dtype="Int64")
+        out["final_grade"] = np.nan
+        if self.explainer is not None:
+            out["top_factors"] = ""
+        if self.explain == "full":
+            out["top_interaction"] = ""
+        out["error"] = errors.to_numpy()
+        if not valid.any():
+            return out
+
+        rows = chunk.loc[valid]
+        columns = {c: pd.to_numeric(rows[c]) for c in input_number_columns}
+        columns.update({c: rows[c].to_numpy(dtype=object) for c in word_columns})
+        engineered, ready = self.feature_encoder.encode_columns(columns)
+        proba = self.scorer.predict_proba(ready)
+        n_numeric = engineered.shape[1]
+        out.loc[valid, "risk_probability"] = proba[:, 1]
+        out.loc[valid, "at_risk"] = self.scorer.classes_[np.argmax(proba, axis=1)]
+        out.loc[valid, "peer_cluster"] = self.peer_index.assign(ready[:, :n_numeric])
+        out.loc[valid, "alcohol_index"] = engineered[:, number_columns.index("alcohol_index")].astype(int)
+        if "G3" in rows.columns:
+            g3 = pd.to_numeric(rows["G3"], errors="coerce").to_numpy()
+            final_grade = np.round((columns["G1"].to_numpy() + columns["G2"].to_numpy() + g3) / 3, 2)
+            out.loc[valid, "final_grade"] = final_grade
+        if self.explainer is not None:
+            self._add_explanations(out, valid, ready)
+        return out
+
+    def _add_explanations(self, out, valid, ready):
+        """Fill top_factors (and top_interaction for depth full) for the valid rows."""
+        shap_matrix = self.explainer.shap_values(ready)
+        top = np.argsort(-np.abs(shap_matrix), axis=1)[:, :TOP_FACTORS]
+        out.loc[valid, "top_factors"] = [
+            ", ".join(f"{self.feature_names[j]} {shap_matrix[row, j]:+.3f}" for j in top[row])
+            for row in range(len(ready))
+        ]
+        if self.explain == "full":
+            pairs = [top_interaction_pair(m) for m in self.explainer.shap_interaction_values(ready)]
+            out.loc[valid, "top_interaction"] = [
+                f"{self.feature_names[i]} + {self.feature_names[j]}: {value:.2f}" for i, j, value in pairs
+            ]
+
+
+_worker_scorer = None
+
+
+def _init_worker(backend, artifacts_dir, data_path, explain):
+    global _worker_scorer
+    _worker_scorer = ChunkScorer(backend, artifacts_dir, data_path, explain)
+
+
+def _score_in_worker(chunk, start_row):
+    return _worker_scorer.score(chunk, start_row)
+
+
+def score_chunks(chunks, start_row=0, workers=1, backend="sklearn", artifacts_dir="artifacts",
+                 data_path=DATA_PATH, explain="none"):
+    """Yield ``(chunk, scored)`` pairs in input order, scoring in ``workers`` processes."""
+    if workers <= 1:
+        scorer = ChunkScorer(backend, artifacts_dir, data_path, explain)
+        for chunk in chunks:
+            yield chunk, scorer.score(chunk, start_row)
+            start_row += len(chunk)
+        return
+
+    prepare_shared_artifacts(backend, artifacts_dir, data_path)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(backend, artifacts_dir, data_path, explain)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_score_in_worker, chunk, start_row)))
+            start_row += len(chunk)
+            if len(pending) >= CHUNKS_PER_WORKER * workers:
+                done_chunk, future = pending.popleft()
+                yield done_chunk, future.result()
+        while pending:
+            done_chunk, future = pending.popleft()
+            yield done_chunk, future.result()
+
+
+def write_output(out, path):
+    """Append a scored chunk to a .csv or .jsonl file."""
+    if path.endswith(".jsonl"):
+        with open(path, "a") as f:
+            for record in out.to_dict(orient="records"):
+                f.write(json.dumps({k: (None if pd.isna(v) else v) for k, v in record.items()}, default=int) + "\n")
+    else:
+        header = not os.path.exists(path) or os.path.getsize(path) == 0
+        out.to_csv(path, mode="a", header=header, index=False, sep=';')
+
+
+def to_results(out, source):
+    """Convert the scored rows of a chunk into user_predictions results."""
+    results = []
+    for record in out[out["error"] == ""].to_dict(orient="records"):
+        results.append({
+            "student_id": int(record["student_id"]),
+            "risk_probability": float(record["risk_probability"]),
+            "at_risk": int(record["at_risk"]),
+            "final_grade": None if pd.isna(record["final_grade"]) else float(record["final_grade"]),
+            "alcohol_index": int(record["alcohol_index"]),
+            "insights": {"source": source, "row": int(record["row"]), "peer_cluster": int(record["peer_cluster"])},
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet extract of students in chunks.")
+    parser.add_argument("input", help="semicolon-separated .csv or .parquet file")
+    parser.add_argument("--output", help="write scores to this .csv or .jsonl file (appended)")
+    parser.add_argument("--db", help="also store scores in this SQLite database (e.g. student_features.db)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--offset", type=int, default=0, help="skip this many input rows (resume)")
+    parser.add_argument("--backend", choices=INFERENCE_BACKENDS, default="sklearn", help="inference backend")
+    parser.add_argument("--artifacts", default="artifacts", help="reference artifacts directory")
+    parser.add_argument("--explain", choices=EXPLAIN_DEPTHS, default="none",
+                        help="add SHAP top factors (main) and the top interaction (full)")
+    parser.add_argument("--workers", type=int, default=1, help="scoring processes (default 1: in-process)")
+    args = parser.parse_args(argv)
+    if not args.output and not args.db:
+        parser.error("give --output and/or --db")
+
+    logging.basicConfig(level=logging.INFO)
+    # Ids come from the database the rows go to; without --db they are only unique within this run
+    ids = IdAllocator(args.db)
+    start, done, failed = time.perf_counter(), 0, 0
+    chunks = read_chunks(args.input, args.chunk_size, args.offset)
+    for chunk, out in score_chunks(chunks, args.offset, args.workers, args.backend, args.artifacts,
+                                   explain=args.explain):
+        out["student_id"] = [ids.next_id() for _ in range(len(out))]
+        if args.output:
+            write_output(out, args.output)
+        if args.db:
+            save_predictions(to_results(out, os.path.basename(args.input)), args.db)
+        done += len(chunk)
+        failed += int((out["error"] != "").sum())
+        elapsed = time.perf_counter() - start
+        logger.info(f"Scored {done} rows ({failed} invalid) at {done / elapsed:.0f} rows/s; "
+                    f"resume with --offset {args.offset + done}")
+    logger.info(f"Finished {done} rows in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
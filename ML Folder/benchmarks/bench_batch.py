@@ -0,0 +1,76 @@
+"""Compare rows/sec of the single-row /predict path with /predict/batch.
+
+Run from the ``ML Folder`` directory so the model files resolve:
+
+    python benchmarks/bench_batch.py --rows 500
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import BENCH_ENV  # noqa: E402
+
+# Same service settings as the benchmark suite: without response caching or
+# persistence both paths do the full work for every row
+os.environ.update(BENCH_ENV)
+
+import app  # noqa: E402 (imported after BENCH_ENV is applied)
+
+# Otherwise whichever path runs first fills the SHAP cache for the other
+app.explainer.cache_size = 0
+
+RAW_COLUMNS = app.input_number_columns + app.word_columns
+
+
+def sample_records(n_rows, seed=42):
+    """Draw student records from the reference dataset, without repeats unless ``n_rows`` exceeds it."""
+    data = app.pd.read_csv(app.DATA_PATH, sep=';')
+    sample = data.sample(n=n_rows, replace=n_rows > len(data), random_state=seed)
+    return [
+        {col: (v.item() if hasattr(v, "item") else v) for col, v in row.items()}
+        for row in sample[RAW_COLUMNS].to_dict(orient="records")
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200, help="number of students to score")
+    args = parser.parse_args()
+
+    records = sample_records(args.rows)
+
+    def single_scoring():
+        for record in records:
+            app.score_features(app.prepare_features([record])[1])
+
+    def batch_scoring():
+        app.score_features(app.prepare_features(records)[1])
+
+    def single_full():
+        for record in records:
+            app.process_user_data(record)
+
+    def batch_full():
+        app.process_batch_data(records)
+
+    print(f"{'stage':<22}{'single rows/s':>16}{'batch rows/s':>16}{'speedup':>10}")
+    for label, single, batch in [
+        ("scoring only", single_scoring, batch_scoring),
+        ("full response", single_full, batch_full),
+    ]:
+        single_rate = args.rows / timed(single)
+        batch_rate = args.rows / timed(batch)
+        print(f"{label:<22}{single_rate:>16.1f}{batch_rate:>16.1f}{batch_rate / single_rate:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
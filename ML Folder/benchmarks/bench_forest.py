@@ -0,0 +1,77 @@
+"""Compare the compiled node-table forest with sklearn's predict_proba.
+
+Checks exact agreement on the held-out split used in training
+(train_test_split(test_size=0.2, random_state=42)), then reports single-row
+p50/p99 latency and batch throughput. Run from the ``ML Folder`` directory:
+
+    python benchmarks/bench_forest.py
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiled_forest import CompiledForest  # noqa: E402
+from features import add_new_columns, number_columns, word_columns  # noqa: E402
+
+
+def held_out_matrix(data_path, scaler, encoder):
+    """Model-ready matrix of the 20% test split of the reference dataset."""
+    data = add_new_columns(pd.read_csv(data_path, sep=';'))
+    _, test = train_test_split(data, test_size=0.2, random_state=42)
+    return np.hstack((scaler.transform(test[number_columns]), encoder.transform(test[word_columns])))
+
+
+def latencies_ms(predict_proba, X, repeats):
+    times = []
+    for i in range(repeats):
+        row = X[i % len(X)][None, :]
+        start = time.perf_counter()
+        predict_proba(row)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, [50, 99])
+
+
+def throughput(predict_proba, X, batch_size, repeats=5):
+    batch = X[np.arange(batch_size) % len(X)]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict_proba(batch)
+    return batch_size * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="student-combined-final.csv")
+    parser.add_argument("--repeats", type=int, default=300, help="single-row calls per backend")
+    args = parser.parse_args()
+
+    model = joblib.load("student_model.joblib")
+    X = held_out_matrix(args.data, joblib.load("scaler.joblib"), joblib.load("encoder.joblib"))
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(model)
+    print(f"Compiled {len(compiled.roots)} trees ({len(compiled.feature)} nodes) "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    expected = model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    exact = np.array_equal(expected, actual)
+    print(f"Held-out rows: {len(X)}, exact match: {exact}, max abs diff: {np.abs(expected - actual).max():.3g}")
+
+    print(f"{'backend':<10}{'p50 ms':>10}{'p99 ms':>10}{'rows/s @1000':>16}")
+    for name, fn in [("sklearn", model.predict_proba), ("compiled", compiled.predict_proba)]:
+        p50, p99 = latencies_ms(fn, X, args.repeats)
+        print(f"{name:<10}{p50:>10.3f}{p99:>10.3f}{throughput(fn, X, 1000):>16.0f}")
+    if not exact:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
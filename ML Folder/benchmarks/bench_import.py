@@ -0,0 +1,90 @@
+"""Check the import-time budget of the core scoring module with ``-X importtime``.
+
+``scoring`` must import within ``--budget-ms`` and, after loading the exported
+artifacts and scoring a student, must not have pulled in any of the heavy
+serving/analysis dependencies. ``app`` is measured for comparison. Run from
+the ``ML Folder`` directory after ``python artifacts.py``:
+
+    python benchmarks/bench_import.py --budget-ms 250
+
+Exits with status 1 when the budget is exceeded or a heavy module was loaded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the core scoring path must not import
+HEAVY_MODULES = ("shap", "sklearn", "scipy", "pandas", "joblib", "numba", "flask")
+
+SCORE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import scoring
+scorer = scoring.Scorer.load({artifacts!r})
+scorer.score(json.loads({record!r}))
+print(json.dumps({{"first_score_s": time.perf_counter() - start,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+EXAMPLE_STUDENT = {
+    "school": "GP", "sex": "F", "age": 17, "famsize": "GT3", "Pstatus": "T",
+    "Medu": 2, "Fedu": 2, "Mjob": "services", "Fjob": "services", "reason": "course",
+    "guardian": "mother", "traveltime": 2, "studytime": 2, "failures": 0,
+    "schoolsup": "yes", "famsup": "no", "paid": "no", "activities": "yes",
+    "nursery": "yes", "higher": "yes", "internet": "yes", "romantic": "no",
+    "famrel": 4, "freetime": 3, "goout": 2, "Dalc": 1, "Walc": 2, "health": 5,
+    "absences": 10, "G1": 12, "G2": 10
+}
+
+
+def import_profile(module):
+    """``{module: (self_us, cumulative_us)}`` from ``python -X importtime -c 'import module'``."""
+    env = dict(os.environ, PERSIST_PREDICTIONS="0", PYTHONWARNINGS="ignore")
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ML_DIR, env=env,
+                            check=True, capture_output=True, text=True).stderr
+    profile = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        profile[name] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="import-time budget for scoring")
+    parser.add_argument("--artifacts", default="artifacts", help="exported artifacts directory")
+    parser.add_argument("--top", type=int, default=8, help="slowest modules to list")
+    parser.add_argument("--skip-app", action="store_true", help="do not profile app.py for comparison")
+    args = parser.parse_args()
+
+    failures = []
+    for module in ["scoring"] + ([] if args.skip_app else ["app"]):
+        profile = import_profile(module)
+        total_ms = profile[module][1] / 1000
+        print(f"import {module}: {total_ms:.1f} ms")
+        for name, (self_us, _) in sorted(profile.items(), key=lambda item: -item[1][0])[:args.top]:
+            print(f"    {self_us / 1000:8.1f} ms  {name}")
+        if module == "scoring" and total_ms > args.budget_ms:
+            failures.append(f"import scoring took {total_ms:.1f} ms (budget {args.budget_ms:g} ms)")
+
+    script = SCORE_SCRIPT.format(artifacts=args.artifacts, record=json.dumps(EXAMPLE_STUDENT), heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], cwd=ML_DIR, check=True, capture_output=True,
+                            text=True).stdout
+    first = json.loads(output.strip().splitlines()[-1])
+    print(f"import + load + first score: {first['first_score_s'] * 1000:.1f} ms")
+    if first["heavy"]:
+        failures.append(f"scoring loaded heavy modules: {first['heavy']}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measure how batch_score.py scales from 1 to N worker processes.
+
+The workload is the reference dataset repeated to ``--rows`` rows and read
+in ``--chunk-size`` chunks. Run from the ``ML Folder`` directory:
+
+    python benchmarks/bench_parallel.py --rows 200000 --max-workers 8
+    python benchmarks/bench_parallel.py --rows 20000 --explain main
+
+``1`` worker scores in-process; higher counts use the process pool with
+memory-mapped reference and forest arrays. Speedup is relative to 1 worker.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+import batch_score  # noqa: E402
+from compiled_forest import INFERENCE_BACKENDS  # noqa: E402
+from shap_explainer import EXPLAIN_DEPTHS  # noqa: E402
+
+
+def write_workload(n_rows, path):
+    """Repeat the reference dataset to ``n_rows`` rows in a semicolon CSV."""
+    data = pd.read_csv(batch_score.DATA_PATH, sep=';')
+    repeats = -(-n_rows // len(data))
+    pd.concat([data] * repeats, ignore_index=True).iloc[:n_rows].to_csv(path, sep=';', index=False)
+
+
+def run(path, workers, args):
+    start = time.perf_counter()
+    rows = 0
+    chunks = batch_score.read_chunks(path, args.chunk_size)
+    for chunk, _ in batch_score.score_chunks(chunks, workers=workers, backend=args.backend, explain=args.explain):
+        rows += len(chunk)
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="rows in the synthetic workload")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows per chunk")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(), help="largest worker count to try")
+    parser.add_argument("--backend", choices=INFERENCE_BACKENDS, default="compiled", help="inference backend")
+    parser.add_argument("--explain", choices=EXPLAIN_DEPTHS, default="none", help="SHAP depth per row")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "workload.csv")
+        write_workload(args.rows, path)
+        print(f"{args.rows} rows, chunks of {args.chunk_size}, backend {args.backend}, "
+              f"explain {args.explain}, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8}{'rows/s':>12}{'speedup':>10}")
+        baseline = None
+        for workers in sorted({1, *range(2, args.max_workers + 1, 2), args.max_workers}):
+            rate = run(path, workers, args)
+            baseline = baseline or rate
+            print(f"{workers:>8}{rate:>12.0f}{rate / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Reproducible latency, throughput and memory benchmark of the prediction service.
+
+Synthetic students are drawn from the column distributions of the reference
+dataset with a fixed seed. The suite measures:
+
+* cold start: importing ``app`` and the first prediction, in fresh processes
+* warm single-prediction latency (p50/p95/p99) per explanation depth
+* ``process_batch_data`` throughput for batches of 1/10/100/1000 rows
+* peak traced memory of each pipeline stage and of each explanation depth
+
+The response and explanation caches, persistence and metrics are disabled
+so every call does the full work. Runs offline on CPU only; from the
+``ML Folder`` directory:
+
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --output new.json --compare bench.json --tolerance 0.15
+
+With ``--compare`` the exit status is 1 when any metric regressed by more
+than the tolerance (latency and memory up, throughput down).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ML_DIR)
+
+from features import input_number_columns, word_columns  # noqa: E402
+
+# Service settings for a benchmark run: no caching, persistence or metrics
+BENCH_ENV = {"RESPONSE_CACHE": "off", "PERSIST_PREDICTIONS": "0", "METRICS": "0", "SERVING_MODE": "sync"}
+
+DEPTHS = ("none", "main", "full")
+BATCH_SIZES = (1, 10, 100, 1000)
+
+# Grade columns are sampled together so grade_change stays realistic
+GRADE_COLUMNS = ["G1", "G2", "G3"]
+
+COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.process_user_data(json.loads({record!r}))
+print(json.dumps({{"import_s": imported - start, "first_prediction_s": time.perf_counter() - imported}}))
+"""
+
+
+def synthetic_students(data, n_rows, seed=42):
+    """Draw ``n_rows`` students, each column from the reference marginal distribution."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for col in input_number_columns + word_columns:
+        if col not in GRADE_COLUMNS:
+            columns[col] = rng.choice(data[col].to_numpy(), size=n_rows)
+    grades = data[[c for c in GRADE_COLUMNS if c in data.columns]].to_numpy()
+    rows = rng.integers(0, len(grades), size=n_rows)
+    for j, col in enumerate(c for c in GRADE_COLUMNS if c in data.columns):
+        columns[col] = grades[rows, j]
+    return [
+        {col: (v.item() if hasattr(v, "item") else v) for col, v in record.items()}
+        for record in pd.DataFrame(columns).to_dict(orient="records")
+    ]
+
+
+def percentiles_ms(times):
+    p50, p95, p99 = np.percentile(np.asarray(times) * 1000, [50, 95, 99])
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3),
+            "mean_ms": round(float(np.mean(times)) * 1000, 3), "n": len(times)}
+
+
+def measure_cold_start(record, runs):
+    """Median import and first-prediction time over ``runs`` fresh interpreters."""
+    env = dict(os.environ, **BENCH_ENV, PYTHONWARNINGS="ignore")
+    script = COLD_START_SCRIPT.format(record=json.dumps(record))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", script], cwd=ML_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: round(float(np.median([s[key] for s in samples])), 4) for key in samples[0]} | {"runs": runs}
+
+
+def measure_latency(app, students, depth, n_requests, warmup=5):
+    for record in students[:warmup]:
+        app.process_user_data(record, depth)
+    times = []
+    for i in range(n_requests):
+        record = students[(warmup + i) % len(students)]
+        start = time.perf_counter()
+        app.process_user_data(record, depth)
+        times.append(time.perf_counter() - start)
+    return percentiles_ms(times)
+
+
+def measure_throughput(app, students, depth, batch_size, min_rows):
+    repeats = max(1, -(-min_rows // batch_size))
+    batches = [[students[(r * batch_size + i) % len(students)] for i in range(batch_size)] for r in range(repeats)]
+    app.process_batch_data(batches[0], depth)
+    start = time.perf_counter()
+    for batch in batches:
+        app.process_batch_data(batch, depth)
+    return round(batch_size * repeats / (time.perf_counter() - start), 1)
+
+
+def peak_bytes(fn):
+    """Run ``fn`` under tracemalloc; return ``(result, peak traced bytes)``."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_memory(app, students):
+    """Peak traced memory of every stage at depth main, and of each full depth."""
+    stages = {}
+    (engineered, ready), stages["encode"] = peak_bytes(lambda: app.prepare_features(students))
+    (risk, at_risk), stages["predict"] = peak_bytes(lambda: app.score_features(ready))
+    explanations, stages["explain_main"] = peak_bytes(lambda: app.explainer.explain(ready, "main"))
+    what_ifs, stages["what_if"] = peak_bytes(lambda: app.standard_what_ifs(engineered, ready))
+    _, stages["insights"] = peak_bytes(lambda: [
+        app.build_result(r, engineered[i], ready[i], risk[i], at_risk[i], explanations[i], what_ifs[i])
+        for i, r in enumerate(students)
+    ])
+    depths = {depth: peak_bytes(lambda: app.process_batch_data(students, depth))[1] for depth in DEPTHS}
+    return {"rows": len(students), "stages_bytes": stages, "depths_bytes": depths}
+
+
+def run_suite(args):
+    os.environ.update(BENCH_ENV)
+    os.chdir(ML_DIR)
+    data = pd.read_csv(args.data, sep=';')
+    students = synthetic_students(data, args.students, seed=args.seed)
+
+    results = {"meta": environment_info(args)}
+    print("cold start...", file=sys.stderr)
+    results["cold_start"] = measure_cold_start(students[0], args.cold_runs)
+
+    import app  # noqa: E402 (imported after BENCH_ENV is applied)
+    app.explainer.cache_size = 0
+
+    results["latency"] = {}
+    for depth in args.depths:
+        print(f"latency {depth}...", file=sys.stderr)
+        n = args.full_requests if depth == "full" else args.requests
+        results["latency"][depth] = measure_latency(app, students, depth, n)
+
+    results["throughput_rows_per_s"] = {}
+    for depth in args.batch_depths:
+        results["throughput_rows_per_s"][depth] = {}
+        for size in BATCH_SIZES:
+            print(f"throughput {depth} x{size}...", file=sys.stderr)
+            results["throughput_rows_per_s"][depth][str(size)] = measure_throughput(
+                app, students, depth, size, args.min_rows)
+
+    print("memory...", file=sys.stderr)
+    results["memory"] = measure_memory(app, students[:args.memory_rows])
+    return results
+
+
+def environment_info(args):
+    import shap
+    import sklearn
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ML_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "shap": shap.__version__,
+        "seed": args.seed,
+        "students": args.students,
+    }
+
+
+def flatten(results):
+    """``{metric path: (value, higher_is_better)}`` for every comparable number."""
+    metrics = {}
+    for key, value in results.get("cold_start", {}).items():
+        if key.endswith("_s"):
+            metrics[f"cold_start.{key}"] = (value, False)
+    for depth, stats in results.get("latency", {}).items():
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            metrics[f"latency.{depth}.{key}"] = (stats[key], False)
+    for depth, sizes in results.get("throughput_rows_per_s", {}).items():
+        for size, value in sizes.items():
+            metrics[f"throughput.{depth}.{size}"] = (value, True)
+    for group in ("stages_bytes", "depths_bytes"):
+        for name, value in results.get("memory", {}).get(group, {}).items():
+            metrics[f"memory.{group}.{name}"] = (value, False)
+    return metrics
+
+
+def compare(current, baseline, tolerance):
+    """Print a table of relative changes; return the regressed metric names."""
+    now, before = flatten(current), flatten(baseline)
+    regressions = []
+    print(f"{'metric':<40}{'baseline':>14}{'current':>14}{'change':>9}")
+    for name in sorted(now.keys() & before.keys()):
+        value, higher_is_better = now[name]
+        reference = before[name][0]
+        change = (value - reference) / reference if reference else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<40}{reference:>14.4g}{value:>14.4g}{change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="student-combined-final.csv", help="reference CSV the students are drawn from")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--seed", type=int, default=42, help="synthetic student seed")
+    parser.add_argument("--students", type=int, default=2000, help="synthetic students generated")
+    parser.add_argument("--requests", type=int, default=200, help="timed single predictions per depth")
+    parser.add_argument("--full-requests", type=int, default=20, help="timed predictions at depth full")
+    parser.add_argument("--depths", nargs="+", choices=DEPTHS, default=list(DEPTHS), help="latency depths")
+    parser.add_argument("--batch-depths", nargs="+", choices=DEPTHS, default=["none", "main"],
+                        help="depths for the batch throughput runs")
+    parser.add_argument("--min-rows", type=int, default=1000, help="rows scored per throughput measurement")
+    parser.add_argument("--memory-rows", type=int, default=100, help="batch size for the memory measurements")
+    parser.add_argument("--cold-runs", type=int, default=3, help="fresh interpreters for the cold start")
+    args = parser.parse_args()
+    args.data, args.output = os.path.abspath(args.data), os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    results = run_suite(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from features import number_columns
+
+# Dimensions the rollups are kept for; "all" holds a single school-wide row
+COHORT_DIMENSIONS = ("all", "school", "sex", "Mjob", "cluster")
+
+# Behavioural risk profile groups reported per student and aggregated per cohort
+FEATURE_GROUPS = {
+    "Academic Effort": ["studytime", "failures", "study_effort"],
+    "Lifestyle": ["Dalc", "Walc", "goout", "alcohol_index"],
+    "Support": ["famrel", "parents_education"],
+}
+
+# Risk probability histogram: RISK_BUCKETS equal-width buckets over [0, 1]
+RISK_BUCKETS = 10
+
+ROLLUP_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS cohort_risk_rollup ("
+    " dimension TEXT NOT NULL, value TEXT NOT NULL, students INTEGER NOT NULL, at_risk INTEGER NOT NULL,"
+    " risk_sum REAL NOT NULL, updated_at REAL, PRIMARY KEY (dimension, value))",
+    "CREATE TABLE IF NOT EXISTS cohort_risk_histogram ("
+    " dimension TEXT NOT NULL, value TEXT NOT NULL, bucket INTEGER NOT NULL, students INTEGER NOT NULL,"
+    " PRIMARY KEY (dimension, value, bucket))",
+    "CREATE TABLE IF NOT EXISTS cohort_shap_rollup ("
+    " dimension TEXT NOT NULL, value TEXT NOT NULL, feature_group TEXT NOT NULL, students INTEGER NOT NULL,"
+    " shap_sum REAL NOT NULL, PRIMARY KEY (dimension, value, feature_group))",
+    "CREATE TABLE IF NOT EXISTS cohort_members ("
+    " student_key TEXT PRIMARY KEY, school TEXT, sex TEXT, Mjob TEXT, cluster TEXT, risk REAL, at_risk INTEGER,"
+    " shap_groups TEXT, updated_at REAL)",
+    "CREATE INDEX IF NOT EXISTS user_predictions_created_at ON user_predictions (created_at)",
+    "CREATE INDEX IF NOT EXISTS user_predictions_at_risk ON user_predictions (at_risk)",
+]
+
+_UPSERT_RISK = (
+    "INSERT INTO cohort_risk_rollup VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (dimension, value) DO UPDATE SET"
+    " students = students + excluded.students, at_risk = at_risk + excluded.at_risk,"
+    " risk_sum = risk_sum + excluded.risk_sum, updated_at = excluded.updated_at"
+)
+_UPSERT_HISTOGRAM = (
+    "INSERT INTO cohort_risk_histogram VALUES (?, ?, ?, ?) ON CONFLICT (dimension, value, bucket) DO UPDATE SET"
+    " students = students + excluded.students"
+)
+_UPSERT_SHAP = (
+    "INSERT INTO cohort_shap_rollup VALUES (?, ?, ?, ?, ?) ON CONFLICT (dimension, value, feature_group)"
+    " DO UPDATE SET students = students + excluded.students, shap_sum = shap_sum + excluded.shap_sum"
+)
+_UPSERT_MEMBER = (
+    "INSERT INTO cohort_members VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (student_key) DO UPDATE SET"
+    " school = excluded.school, sex = excluded.sex, Mjob = excluded.Mjob, cluster = excluded.cluster,"
+    " risk = excluded.risk, at_risk = excluded.at_risk, shap_groups = excluded.shap_groups,"
+    " updated_at = excluded.updated_at"
+)
+_MEMBER_COLUMNS = "student_key, school, sex, Mjob, cluster, risk, at_risk, shap_groups"
+
+# Bound on ``?`` parameters per member lookup
+_LOOKUP_CHUNK = 500
+
+
+def ensure_schema(conn):
+    """Create the rollup tables and indexes if they do not exist yet."""
+    for statement in ROLLUP_SCHEMA:
+        conn.execute(statement)
+
+
+def connect_readonly(db_path):
+    """Open a read-only connection for serving rollup queries."""
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+
+
+def risk_bucket(probability):
+    return min(int(probability * RISK_BUCKETS), RISK_BUCKETS - 1)
+
+
+class CohortRollups:
+    """Keeps per-cohort rollup tables in step with the stored predictions.
+
+    ``apply`` runs inside the prediction store's insert transaction, so the
+    rollups commit together with the predictions. Every student counts once:
+    ``cohort_members`` holds each student's current contribution under the
+    observation's ``key`` (a hash of the input fields). A repeat view with an
+    unchanged contribution is skipped; a changed one (re-scored by a new
+    model, moved to another peer cluster, or explained for the first time)
+    replaces the old one. A contribution is one row per dimension
+    (school-wide, school, sex, Mjob and peer cluster) of student and at-risk
+    counts, the risk sum, a risk histogram bucket and, once the student was
+    explained, the per-group SHAP sums.
+
+    ``encode_fn`` maps raw records to model-ready rows and ``peer_index_fn``
+    returns the current ``PeerIndex``; SHAP vectors come with the observations.
+    """
+
+    def __init__(self, encode_fn, peer_index_fn, feature_names):
+        self.encode_fn = encode_fn
+        self.peer_index_fn = peer_index_fn
+        self.group_columns = {
+            group: [feature_names.index(f) for f in features if f in feature_names]
+            for group, features in FEATURE_GROUPS.items()
+        }
+
+    def apply(self, conn, observations):
+        """Fold ``Observation``s into the rollups using ``conn``."""
+        latest = {}
+        for o in observations:
+            previous = latest.get(o.key)
+            if o.shap is None and previous is not None and previous.shap is not None:
+                o = o._replace(shap=previous.shap)
+            latest[o.key] = o
+        if not latest:
+            return
+        observations = list(latest.values())
+        ready = self.encode_fn([o.record for o in observations])
+        clusters = self.peer_index_fn().assign(ready[:, :len(number_columns)])
+        members = self._members(conn, list(latest))
+
+        now = time.time()
+        risk, histogram, shap, rows = {}, {}, {}, []
+        for o, cluster in zip(observations, clusters):
+            old = members.get(o.key)
+            groups = self._group_sums(o.shap)
+            if groups is None and old is not None:
+                groups = old[6]
+            new = (o.record["school"], o.record["sex"], o.record["Mjob"], str(int(cluster)),
+                   float(o.result["risk_probability"]), int(o.result["at_risk"]), groups)
+            if new == old:
+                continue
+            if old is not None:
+                self._add(risk, histogram, shap, old, -1)
+            self._add(risk, histogram, shap, new, 1)
+            rows.append((o.key,) + new[:6] + (None if groups is None else json.dumps(groups), now))
+
+        conn.executemany(_UPSERT_MEMBER, rows)
+        conn.executemany(_UPSERT_RISK, [key + tuple(values) + (now,) for key, values in risk.items()])
+        conn.executemany(_UPSERT_HISTOGRAM, [key + (count,) for key, count in histogram.items()])
+        conn.executemany(_UPSERT_SHAP, [key + tuple(values) for key, values in shap.items()])
+
+    def _members(self, conn, keys):
+        """Current contributions of the students in ``keys``, in the layout ``apply`` compares."""
+        members = {}
+        for i in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[i:i + _LOOKUP_CHUNK]
+            query = f"SELECT {_MEMBER_COLUMNS} FROM cohort_members WHERE student_key IN ({', '.join('?' * len(chunk))})"
+            for key, school, sex, mjob, cluster, risk, at_risk, groups in conn.execute(query, chunk):
+                members[key] = (school, sex, mjob, cluster, risk, at_risk,
+                                None if groups is None else json.loads(groups))
+        return members
+
+    def _group_sums(self, shap_vector):
+        if shap_vector is None:
+            return None
+        shap_vector = np.asarray(shap_vector, dtype=np.float64)
+        return {group: float(shap_vector[cols].sum()) for group, cols in self.group_columns.items()}
+
+    @staticmethod
+    def _add(risk, histogram, shap, contribution, sign):
+        """Accumulate ``sign`` times one student's contribution into the per-cohort deltas."""
+        school, sex, mjob, cluster, probability, at_risk, groups = contribution
+        keys = [("all", "all"), ("school", school), ("sex", sex), ("Mjob", mjob), ("cluster", cluster)]
+        for key in keys:
+            totals = risk.setdefault(key, [0, 0, 0.0])
+            totals[0] += sign
+            totals[1] += sign * at_risk
+            totals[2] += sign * probability
+            bucket_key = key + (risk_bucket(probability),)
+            histogram[bucket_key] = histogram.get(bucket_key, 0) + sign
+            for group, value in (groups or {}).items():
+                totals = shap.setdefault(key + (group,), [0, 0.0])
+                totals[0] += sign
+                totals[1] += sign * value
+
+
+def risk_distribution(conn, dimension, value=None):
+    """Per-cohort counts, at-risk rate, mean risk and risk histogram for one dimension."""
+    query = "SELECT value, students, at_risk, risk_sum FROM cohort_risk_rollup WHERE dimension = ? AND students > 0"
+    params = [dimension]
+    if value is not None:
+        query += " AND value = ?"
+        params.append(value)
+    cohorts = {}
+    for cohort, students, at_risk, risk_sum in conn.execute(query + " ORDER BY value", params):
+        cohorts[cohort] = {
+            "value": cohort, "students": students, "at_risk": at_risk,
+            "at_risk_rate": round(at_risk / students, 4) if students else 0.0,
+            "mean_risk": round(risk_sum / students, 4) if students else 0.0,
+            "histogram": [0] * RISK_BUCKETS,
+        }
+    query = "SELECT value, bucket, students FROM cohort_risk_histogram WHERE dimension = ?"
+    for cohort, bucket, students in conn.execute(query + (" AND value = ?" if value is not None else ""), params):
+        if cohort in cohorts:
+            cohorts[cohort]["histogram"][bucket] = students
+    return list(cohorts.values())
+
+
+def shap_attribution(conn, dimension, value=None):
+    """Mean SHAP attribution per feature group for each cohort of one dimension."""
+    query = ("SELECT value, feature_group, students, shap_sum FROM cohort_shap_rollup"
+             " WHERE dimension = ? AND students > 0")
+    params = [dimension]
+    if value is not None:
+        query += " AND value = ?"
+        params.append(value)
+    cohorts = {}
+    for cohort, group, students, shap_sum in conn.execute(query + " ORDER BY value", params):
+        entry = cohorts.setdefault(cohort, {"value": cohort, "explained_students": students, "mean_shap": {}})
+        entry["mean_shap"][group] = round(shap_sum / students, 6) if students else 0.0
+    return list(cohorts.values())
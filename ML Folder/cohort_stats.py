@@ -0,0 +1,170 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from peer_index import PeerIndex
+
+logger = logging.getLogger(__name__)
+
+
+def observation_values(record, result, metrics):
+    """Peer metric values of one scored student (NaN where unknown).
+
+    Raw fields come from the request, derived ones are recomputed and
+    ``at_risk``/``final_grade`` are taken from the prediction.
+    """
+    derived = {
+        "alcohol_index": record["Dalc"] + record["Walc"],
+        "parents_education": record["Medu"] + record["Fedu"],
+        "final_grade": result.get("final_grade"),
+        "at_risk": result.get("at_risk"),
+    }
+    values = []
+    for metric in metrics:
+        value = derived[metric] if metric in derived else record.get(metric)
+        values.append(np.nan if value is None else float(value))
+    return values
+
+
+class CohortStats:
+    """Running per-cluster means/variances and absence mean, seeded from the reference data.
+
+    Updates use Chan's parallel form of Welford's algorithm, so each batch of
+    new predictions costs O(batch) and history is never reprocessed. Each
+    student counts once: observations whose ``key`` was already folded in
+    (a counsellor re-opening the same student) are skipped. Identical inputs
+    give identical values, so there is nothing to replace.
+    ``scale_fn`` maps raw records to the scaled numeric rows used for peer
+    assignment. Every update publishes a new ``PeerIndex`` (centroids plus
+    statistics table) through ``on_publish(index, reclustered)``; readers keep
+    whichever consistent index they hold.
+
+    With ``recluster_every`` set, the scaled rows of new students are
+    buffered and a background thread feeds them to a MiniBatchKMeans that
+    starts from the fitted centroids and was primed on the reference matrix.
+    Cluster ids keep their meaning, so the running statistics carry over
+    when the moved centroids are swapped in.
+    """
+
+    def __init__(self, peer_index, reference, scale_fn, on_publish=None, recluster_every=0):
+        stats = reference.stats
+        self.metrics = [c[:-len("_mean")] for c in stats.columns if c.endswith("_mean")]
+        self.columns = list(stats.columns)
+        n_clusters = len(stats)
+        self.sizes = stats["count"].to_numpy(dtype=np.float64).copy()
+        self.means = stats[[f"{m}_mean" for m in self.metrics]].to_numpy(dtype=np.float64).copy()
+        variances = stats[[f"{m}_std" for m in self.metrics]].to_numpy(dtype=np.float64) ** 2
+        self.counts = np.repeat(self.sizes[:, None], len(self.metrics), axis=1)
+        self.m2 = variances * self.counts
+        self.absence_count = float(len(reference.X_scaled))
+        self.absence_mean = float(reference.absence_mean)
+        self.observed = 0
+        self.reclusters = 0
+        self.peer_index = peer_index
+        self.scale_fn = scale_fn
+        self.on_publish = on_publish
+        self.recluster_every = recluster_every
+        self._reference_rows = reference.X_scaled
+        self._n_clusters = n_clusters
+        self._kmeans = None
+        self._pending_rows = []
+        self._seen = set()
+        self._reclustering = False
+        self._lock = threading.Lock()
+
+    def observe(self, observations):
+        """Fold stored ``Observation``s of new students into the statistics and publish them.
+
+        Used as a ``PredictionStore`` listener, so it runs off the request path.
+        """
+        with self._lock:
+            new = {}
+            for o in observations:
+                if o.key not in self._seen:
+                    new.setdefault(o.key, o)
+            self._seen.update(new)
+        if not new:
+            return
+        records = [o.record for o in new.values()]
+        results = [o.result for o in new.values()]
+        scaled_rows = np.asarray(self.scale_fn(records), dtype=np.float64)
+        values = np.array([observation_values(r, res, self.metrics) for r, res in zip(records, results)])
+        absences = np.array([float(r["absences"]) for r in records])
+        with self._lock:
+            clusters = self.peer_index.assign(scaled_rows)
+            for cluster in np.unique(clusters):
+                self._combine(int(cluster), values[clusters == cluster])
+            absences = absences[~np.isnan(absences)]
+            total = self.absence_count + len(absences)
+            if len(absences):
+                self.absence_mean += (absences.sum() - len(absences) * self.absence_mean) / total
+            self.absence_count = total
+            self.observed += len(records)
+            self._publish(self.peer_index.centroids, reclustered=False)
+            if self.recluster_every:
+                self._pending_rows.append(scaled_rows)
+                if sum(len(r) for r in self._pending_rows) >= self.recluster_every and not self._reclustering:
+                    rows, self._pending_rows = np.vstack(self._pending_rows), []
+                    self._reclustering = True
+                    threading.Thread(target=self._recluster, args=(rows,), name="cohort-recluster",
+                                     daemon=True).start()
+
+    def table(self):
+        """Current statistics in the layout of ``peer_index.cluster_statistics``."""
+        with self._lock:
+            return self._table()
+
+    def info(self):
+        with self._lock:
+            return {"observed": self.observed, "absence_mean": float(self.absence_mean),
+                    "reclusters": self.reclusters, "recluster_every": self.recluster_every}
+
+    def _combine(self, cluster, batch):
+        present = ~np.isnan(batch)
+        n_b = present.sum(axis=0).astype(np.float64)
+        safe = np.where(present, batch, 0.0)
+        mean_b = np.divide(safe.sum(axis=0), n_b, out=np.zeros_like(n_b), where=n_b > 0)
+        m2_b = (np.where(present, batch - mean_b, 0.0) ** 2).sum(axis=0)
+        n_a, mean_a = self.counts[cluster], self.means[cluster]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        weight = np.divide(n_b, n, out=np.zeros_like(n), where=n > 0)
+        self.means[cluster] = mean_a + delta * weight
+        self.m2[cluster] += m2_b + delta ** 2 * n_a * weight
+        self.counts[cluster] = n
+        self.sizes[cluster] += len(batch)
+
+    def _table(self):
+        stds = np.sqrt(np.divide(self.m2, self.counts, out=np.zeros_like(self.m2), where=self.counts > 0))
+        data = {"count": self.sizes.copy()}
+        data.update({f"{m}_mean": self.means[:, i].copy() for i, m in enumerate(self.metrics)})
+        data.update({f"{m}_std": stds[:, i] for i, m in enumerate(self.metrics)})
+        return pd.DataFrame(data, index=range(self._n_clusters))[self.columns]
+
+    def _publish(self, centroids, reclustered):
+        index = PeerIndex(centroids, self.peer_index.labels, self._table(), assignment="centroid")
+        self.peer_index = index
+        if self.on_publish is not None:
+            self.on_publish(index, reclustered)
+
+    def _recluster(self, rows):
+        try:
+            from sklearn.cluster import MiniBatchKMeans
+
+            if self._kmeans is None:
+                # Prime the counts on the reference rows so new data nudges, not replaces, the centroids
+                self._kmeans = MiniBatchKMeans(n_clusters=self._n_clusters, init=self.peer_index.centroids,
+                                               n_init=1, random_state=42)
+                self._kmeans.partial_fit(np.asarray(self._reference_rows))
+            self._kmeans.partial_fit(rows)
+            centroids = self._kmeans.cluster_centers_.copy()
+            with self._lock:
+                self.reclusters += 1
+                self._publish(centroids, reclustered=True)
+            logger.info(f"Re-clustered peer groups with {len(rows)} new students")
+        except Exception as e:
+            logger.error(f"Peer group re-clustering failed: {str(e)}")
+        finally:
+            self._reclustering = False
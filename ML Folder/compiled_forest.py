@@ -0,0 +1,143 @@
+import json
+import os
+
+import numpy as np
+
+from artifacts import file_sha256
+
+# Inference backends the service can score with
+INFERENCE_BACKENDS = ("sklearn", "compiled")
+
+# Node tables written by CompiledForest.save, one .npy file each
+FOREST_ARRAYS = ("feature", "threshold", "left", "right", "leaf_value", "roots", "children", "is_leaf")
+FOREST_MANIFEST = "forest.json"
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier flattened into contiguous node tables.
+
+    Every tree's nodes are stored in shared ``feature``, ``threshold``,
+    ``left``, ``right`` and ``leaf_value`` arrays (global node ids, one root per
+    tree). All (tree, row) pairs are traversed together, one vectorized step
+    per level, dropping pairs as they reach a leaf. Splits compare float32 inputs
+    with the float64 thresholds and per-tree probabilities are accumulated in
+    estimator order, as sklearn does, so results match ``predict_proba`` exactly.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_value, roots, max_depth, classes, n_features,
+                 children=None, is_leaf=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        # children[2 * node + go_left] is the next node; leaves loop to themselves
+        self.children = np.stack([right, left], axis=1).ravel() if children is None else children
+        self.is_leaf = left == np.arange(len(left)) if is_leaf is None else is_leaf
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten the trees of a fitted single-output forest classifier."""
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+            # Leaves loop back to themselves and test feature 0 against +inf
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, ids, tree.children_right) + offset)
+            value = tree.value[:, 0, :].astype(np.float64)
+            totals = value.sum(axis=1, keepdims=True)
+            if not np.allclose(totals[is_leaf], 1.0):
+                # Releases before sklearn 1.4 store class counts rather than fractions
+                value = value / np.where(totals == 0, 1.0, totals)
+            values.append(value)
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+        return cls(
+            np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            np.asarray(roots, dtype=np.intp),
+            int(max_depth),
+            np.asarray(model.classes_),
+            int(model.n_features_in_),
+        )
+
+    def save(self, out_dir, model_path=None):
+        """Write the node tables as ``.npy`` files plus a small manifest.
+
+        ``model_path`` records the checksum of the joblib model they came from,
+        so ``load`` can refuse tables compiled from a different model.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        for name in FOREST_ARRAYS:
+            np.save(os.path.join(out_dir, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        manifest = {
+            "max_depth": self.max_depth,
+            "classes": self.classes_.tolist(),
+            "n_features": self.n_features_in_,
+            "model_sha256": None if model_path is None else file_sha256(model_path),
+        }
+        with open(os.path.join(out_dir, FOREST_MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, out_dir, model_path=None, mmap_mode="r"):
+        """Open tables written by ``save``, memory-mapped so processes share one copy.
+
+        Raises FileNotFoundError when nothing was saved and ValueError when the
+        tables were compiled from a different model than ``model_path``.
+        """
+        manifest_path = os.path.join(out_dir, FOREST_MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No compiled forest at {manifest_path}")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if model_path is not None and manifest["model_sha256"] not in (None, file_sha256(model_path)):
+            raise ValueError(f"Compiled forest in {out_dir} was built from a different {os.path.basename(model_path)}")
+        arrays = {name: np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode=mmap_mode) for name in FOREST_ARRAYS}
+        return cls(arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"], arrays["leaf_value"],
+                   arrays["roots"], manifest["max_depth"], np.asarray(manifest["classes"]), manifest["n_features"],
+                   children=arrays["children"], is_leaf=arrays["is_leaf"])
+
+    def apply(self, X):
+        """Leaf node id reached in every tree, as an ``(n_trees, n_rows)`` array."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        nodes = np.repeat(self.roots, n_rows)
+        row_offsets = np.tile(np.arange(n_rows) * n_features, len(self.roots))
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            go_left = flat_X[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            nodes[active] = self.children[2 * current + go_left]
+            active = active[~self.is_leaf[nodes[active]]]
+        return nodes.reshape(len(self.roots), n_rows)
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over the trees, shape ``(n_rows, n_classes)``."""
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], self.leaf_value.shape[1]), dtype=np.float64)
+        for tree_leaves in leaves:
+            proba += self.leaf_value[tree_leaves]
+        proba /= len(leaves)
+        return proba
+
+    def predict(self, X):
+        """Most probable class of every row."""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
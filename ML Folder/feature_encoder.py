@@ -0,0 +1,123 @@
+import json
+
+import numpy as np
+
+from features import input_number_columns, number_columns, training_absence_mean, word_columns
+
+
+class CompiledFeatureEncoder:
+    """Turns raw student dicts into the model matrix with NumPy only.
+
+    Built from the fitted ``StandardScaler`` means/scales and ``OneHotEncoder``
+    vocabularies, it reproduces ``np.hstack((scaler.transform(numbers),
+    encoder.transform(words)))`` bit for bit without creating DataFrames.
+    ``high_absences`` compares against the training-set absence mean, taken
+    from the scaler.
+    """
+
+    def __init__(self, mean, scale, vocabularies, n_word_features, absence_mean):
+        self.mean = mean
+        self.scale = scale
+        self.vocabularies = vocabularies
+        self.n_word_features = n_word_features
+        self.absence_mean = float(absence_mean)
+        self.n_features = len(number_columns) + n_word_features
+        self._raw_index = {col: i for i, col in enumerate(input_number_columns)}
+
+    @classmethod
+    def from_fitted(cls, scaler, encoder):
+        """Extract the parameters of a fitted scaler and one-hot encoder."""
+        mean = np.zeros(len(number_columns)) if scaler.mean_ is None else np.asarray(scaler.mean_, dtype=np.float64)
+        scale = np.ones(len(number_columns)) if scaler.scale_ is None else np.asarray(scaler.scale_, dtype=np.float64)
+        drop_idx = getattr(encoder, "drop_idx_", None)
+        vocabularies, offset = [], len(number_columns)
+        for i, categories in enumerate(encoder.categories_):
+            dropped = None if drop_idx is None else drop_idx[i]
+            vocabulary, column = {}, offset
+            for j, category in enumerate(categories):
+                if dropped is not None and j == dropped:
+                    vocabulary[category] = None  # encoded as all zeros
+                else:
+                    vocabulary[category] = column
+                    column += 1
+            vocabularies.append(vocabulary)
+            offset = column
+        return cls(mean, scale, vocabularies, offset - len(number_columns), training_absence_mean(scaler))
+
+    def save(self, path):
+        """Write the parameters as JSON so ``load`` needs neither sklearn nor joblib."""
+        params = {
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "vocabularies": [list(vocabulary.items()) for vocabulary in self.vocabularies],
+            "n_word_features": self.n_word_features,
+            "absence_mean": self.absence_mean,
+        }
+        with open(path, "w") as f:
+            json.dump(params, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Read parameters written by ``save``."""
+        with open(path) as f:
+            params = json.load(f)
+        return cls(np.asarray(params["mean"], dtype=np.float64), np.asarray(params["scale"], dtype=np.float64),
+                   [dict(pairs) for pairs in params["vocabularies"]], params["n_word_features"],
+                   params["absence_mean"])
+
+    def engineer(self, raw):
+        """Engineered, unscaled numeric features from an ``(n_rows, len(input_number_columns))`` matrix."""
+        c = {col: raw[:, i] for col, i in self._raw_index.items()}
+        derived = {
+            "study_effort": c["studytime"] * (5 - c["traveltime"]),
+            "alcohol_index": c["Dalc"] + c["Walc"],
+            "parents_education": c["Medu"] + c["Fedu"],
+            "grade_change": c["G2"] - c["G1"],
+            "high_absences": (c["absences"] > self.absence_mean).astype(np.float64),
+        }
+        engineered = np.empty((len(raw), len(number_columns)), dtype=np.float64)
+        for j, col in enumerate(number_columns):
+            engineered[:, j] = c[col] if col in c else derived[col]
+        return engineered
+
+    def encode(self, records, dtype=np.float64):
+        """Return ``(engineered, ready)`` for a dict or list of dicts.
+
+        ``ready`` is the preallocated model matrix: scaled numeric columns
+        followed by the one-hot block. Raises ValueError for unknown categories.
+        """
+        if isinstance(records, dict):
+            records = [records]
+        raw = np.array([[record[col] for col in input_number_columns] for record in records], dtype=np.float64)
+        engineered = self.engineer(raw.reshape(len(records), len(input_number_columns)))
+        ready = np.zeros((len(records), self.n_features), dtype=dtype)
+        ready[:, :len(number_columns)] = (engineered - self.mean) / self.scale
+        for row, record in enumerate(records):
+            for col, vocabulary in zip(word_columns, self.vocabularies):
+                try:
+                    column = vocabulary[record[col]]
+                except KeyError:
+                    raise ValueError(f"Unknown category {record[col]!r} for {col}") from None
+                if column is not None:
+                    ready[row, column] = 1.0
+        return engineered, ready
+
+    def encode_columns(self, columns, dtype=np.float64):
+        """Columnar variant of ``encode`` for a DataFrame or ``{column: array}`` mapping.
+
+        Each categorical column is mapped through its vocabulary once per
+        distinct value rather than once per row.
+        """
+        raw = np.column_stack([np.asarray(columns[col], dtype=np.float64) for col in input_number_columns])
+        engineered = self.engineer(raw)
+        ready = np.zeros((len(raw), self.n_features), dtype=dtype)
+        ready[:, :len(number_columns)] = (engineered - self.mean) / self.scale
+        for col, vocabulary in zip(word_columns, self.vocabularies):
+            uniques, inverse = np.unique(np.asarray(columns[col], dtype=object), return_inverse=True)
+            unknown = [u for u in uniques if u not in vocabulary]
+            if unknown:
+                raise ValueError(f"Unknown category {unknown[0]!r} for {col}")
+            targets = np.array([-1 if vocabulary[u] is None else vocabulary[u] for u in uniques])[inverse.ravel()]
+            rows = np.flatnonzero(targets >= 0)
+            ready[rows, targets[rows]] = 1.0
+        return engineered, ready
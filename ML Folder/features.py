@@ -0,0 +1,48 @@
+import numpy as np
+
+# Define columns (same as training)
+number_columns = [
+    "age", "Medu", "Fedu", "traveltime", "studytime", "failures",
+    "famrel", "freetime", "goout", "Dalc", "Walc", "health", "absences",
+    "G1", "G2", "study_effort", "alcohol_index", "parents_education",
+    "grade_change", "high_absences"
+]
+word_columns = [
+    "school", "sex", "famsize", "Pstatus", "Mjob", "Fjob", "reason",
+    "guardian", "schoolsup", "famsup", "paid", "activities", "nursery",
+    "higher", "internet", "romantic"
+]
+
+# Raw numeric fields a student record must provide (engineered columns are derived)
+input_number_columns = [
+    "age", "Medu", "Fedu", "traveltime", "studytime", "failures",
+    "famrel", "freetime", "goout", "Dalc", "Walc", "health", "absences",
+    "G1", "G2"
+]
+
+def training_absence_mean(scaler):
+    """The model's ``high_absences`` cut-off: mean absences of the rows ``scaler`` was fitted on.
+
+    Read from the fitted scaler, so it stays fixed however the reference CSV grows.
+    """
+    return float(scaler.mean_[number_columns.index("absences")])
+
+def add_new_columns(data, avg_absences=None):
+    """Add engineered features to the dataset.
+
+    ``avg_absences`` is the cut-off for ``high_absences``; it defaults to the
+    mean of ``data`` and may be a scalar or a Series aligned with ``data``.
+    """
+    if 'G3' in data.columns:
+        data["final_grade"] = (data["G1"] + data["G2"] + data["G3"]) / 3
+        data["final_grade"] = data["final_grade"].round(2)
+    else:
+        data['final_grade'] = np.nan
+    data["alcohol_index"] = data["Dalc"] + data["Walc"]
+    data["parents_education"] = data["Medu"] + data["Fedu"]
+    data["grade_change"] = data["G2"] - data["G1"]
+    if avg_absences is None:
+        avg_absences = data["absences"].mean()
+    data["high_absences"] = (data["absences"] > avg_absences).astype(int)
+    data["study_effort"] = data["studytime"] * (5 - data["traveltime"])
+    return data
@@ -0,0 +1,251 @@
+"""Offline SHAP values for the whole reference dataset.
+
+Every reference row is encoded with the exported encoder parameters and
+explained in fixed-size chunks (optionally across worker processes). The
+class-1 SHAP values are stored as a float32 ``.npy`` matrix that the service
+memory-maps, together with each row's peer cluster and a manifest holding the
+global feature importances:
+
+    python artifacts.py
+    python global_shap.py --data student-combined-final.csv --workers 4
+
+Re-running after rows were appended to the CSV (and ``artifacts.py`` was
+re-run for them) only explains the new rows, as long as the model, encoder
+parameters and the previously explained rows are unchanged; anything else
+triggers a full rebuild. Peer clusters are reassigned on every run, so new
+centroids alone do not invalidate the SHAP values.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from artifacts import ARRAY_FILES, ENCODER_FILE, file_sha256
+from cohort_rollups import FEATURE_GROUPS
+from features import number_columns
+from peer_index import PeerIndex
+
+logger = logging.getLogger(__name__)
+
+SHAP_FILE = "reference_shap.npy"
+SHAP_CLUSTERS_FILE = "reference_shap_clusters.npy"
+SHAP_MANIFEST = "reference_shap.json"
+DEFAULT_CHUNK_SIZE = 512
+
+
+def rows_digest(ready):
+    """SHA-256 of the encoded rows, used to detect edits to already explained rows."""
+    return hashlib.sha256(np.ascontiguousarray(ready, dtype=np.float64).tobytes()).hexdigest()
+
+
+def _init_worker(model_path, shap_path):
+    global _worker_explainer, _worker_output
+    import joblib
+    from shap_explainer import SharedExplainer
+
+    _worker_explainer = SharedExplainer(joblib.load(model_path), cache_size=0)
+    _worker_output = np.load(shap_path, mmap_mode="r+")
+
+
+def _explain_chunk(start, ready):
+    # Workers write straight into the shared output file; only row ranges travel back
+    _worker_output[start:start + len(ready)] = _worker_explainer.shap_values(ready)
+    _worker_output.flush()
+    return start, len(ready)
+
+
+def compute_shap(ready, out_path, model_path, start=0, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """Explain ``ready[start:]`` in chunks into the float32 ``.npy`` file at ``out_path``."""
+    chunks = [(i, ready[i:i + chunk_size]) for i in range(start, len(ready), chunk_size)]
+    if not chunks:
+        return
+    if workers <= 1:
+        _init_worker(model_path, out_path)
+        for i, chunk in chunks:
+            _explain_chunk(i, chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path, out_path)) as pool:
+        for _ in pool.map(_explain_chunk, *zip(*chunks)):
+            pass
+
+
+def build_global_shap(data, artifacts_dir="artifacts", model_path="student_model.joblib", feature_names=None,
+                      chunk_size=DEFAULT_CHUNK_SIZE, workers=1, full=False):
+    """Create or extend the reference SHAP matrix in ``artifacts_dir``; return the manifest.
+
+    ``data`` is the raw reference DataFrame. Raises FileNotFoundError when the
+    scoring artifacts (encoder parameters, centroids) were not built yet.
+    """
+    from feature_encoder import CompiledFeatureEncoder
+
+    encoder_path = os.path.join(artifacts_dir, ENCODER_FILE)
+    centroids_path = os.path.join(artifacts_dir, ARRAY_FILES["centroids"])
+    feature_encoder = CompiledFeatureEncoder.load(encoder_path)
+    centroids = np.load(centroids_path)
+    _, ready = feature_encoder.encode_columns(data)
+    clusters = PeerIndex(centroids, [], stats=None).assign(ready[:, :len(number_columns)]).astype(np.int32)
+    sources = {
+        "model_sha256": file_sha256(model_path),
+        "encoder_sha256": file_sha256(encoder_path),
+    }
+
+    shap_path = os.path.join(artifacts_dir, SHAP_FILE)
+    manifest_path = os.path.join(artifacts_dir, SHAP_MANIFEST)
+    previous = {}
+    if not full and os.path.exists(manifest_path) and os.path.exists(shap_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    done = previous.get("n_rows", 0)
+    reusable = (
+        previous.get("sources") == sources
+        and done <= len(ready)
+        and previous.get("rows_sha256") == rows_digest(ready[:done])
+    )
+    if not reusable:
+        done = 0
+
+    tmp_path = shap_path + ".tmp"
+    output = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=ready.shape)
+    if done:
+        output[:done] = np.load(shap_path, mmap_mode="r")
+    output.flush()
+    del output
+    start = time.perf_counter()
+    compute_shap(ready, tmp_path, model_path, start=done, chunk_size=chunk_size, workers=workers)
+    elapsed = time.perf_counter() - start
+    os.replace(tmp_path, shap_path)
+    np.save(os.path.join(artifacts_dir, SHAP_CLUSTERS_FILE), clusters)
+
+    shap_matrix = np.load(shap_path, mmap_mode="r")
+    abs_mean = np.zeros(ready.shape[1])
+    signed_mean = np.zeros(ready.shape[1])
+    for i in range(0, len(shap_matrix), 65536):
+        block = np.asarray(shap_matrix[i:i + 65536], dtype=np.float64)
+        abs_mean += np.abs(block).sum(axis=0)
+        signed_mean += block.sum(axis=0)
+    n_rows = max(len(shap_matrix), 1)
+    manifest = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_rows": int(len(ready)),
+        "n_features": int(ready.shape[1]),
+        "explained_rows": int(len(ready) - done),
+        "seconds": round(elapsed, 3),
+        "sources": sources,
+        "centroids_sha256": file_sha256(centroids_path),
+        "rows_sha256": rows_digest(ready),
+        "shap_sha256": file_sha256(shap_path),
+        "feature_names": list(feature_names) if feature_names is not None else None,
+        "mean_abs_shap": (abs_mean / n_rows).tolist(),
+        "mean_shap": (signed_mean / n_rows).tolist(),
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class GlobalExplanations:
+    """Memory-mapped reference SHAP values with per-group percentiles and importances.
+
+    Group attributions are the sums of the ``FEATURE_GROUPS`` SHAP values;
+    each group's values are kept sorted overall and per peer cluster, so a
+    student's percentile is a binary search.
+    """
+
+    def __init__(self, shap_matrix, clusters, manifest, feature_names):
+        self.shap = shap_matrix
+        self.clusters = np.asarray(clusters)
+        self.manifest = manifest
+        self.feature_names = list(feature_names)
+        self.group_columns = {
+            group: [self.feature_names.index(f) for f in features if f in self.feature_names]
+            for group, features in FEATURE_GROUPS.items()
+        }
+        group_values = np.column_stack([
+            np.asarray(shap_matrix[:, cols], dtype=np.float64).sum(axis=1) for cols in self.group_columns.values()
+        ])
+        self._sorted = {None: np.sort(group_values, axis=0)}
+        for cluster in np.unique(self.clusters):
+            self._sorted[int(cluster)] = np.sort(group_values[self.clusters == cluster], axis=0)
+
+    @classmethod
+    def load(cls, artifacts_dir="artifacts", model_path=None, feature_names=None):
+        """Memory-map the output of ``build_global_shap``.
+
+        Raises FileNotFoundError if it was not built and ValueError if it was
+        computed for a different ``model_path``.
+        """
+        manifest_path = os.path.join(artifacts_dir, SHAP_MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No reference SHAP manifest at {manifest_path}")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if model_path is not None and manifest["sources"]["model_sha256"] != file_sha256(model_path):
+            raise ValueError(f"Reference SHAP values in {artifacts_dir} were computed for a different model")
+        shap_matrix = np.load(os.path.join(artifacts_dir, SHAP_FILE), mmap_mode="r")
+        clusters = np.load(os.path.join(artifacts_dir, SHAP_CLUSTERS_FILE), mmap_mode="r")
+        return cls(shap_matrix, clusters, manifest, feature_names or manifest["feature_names"])
+
+    @property
+    def checksum(self):
+        return self.manifest.get("shap_sha256")
+
+    def percentiles(self, shap_vector, cluster=None):
+        """Percentile of each group's attribution among all reference rows and within ``cluster``."""
+        shap_vector = np.asarray(shap_vector, dtype=np.float64)
+        result = {}
+        for j, (group, cols) in enumerate(self.group_columns.items()):
+            value = shap_vector[cols].sum()
+            entry = {"all": self._percentile(None, j, value)}
+            if cluster is not None and int(cluster) in self._sorted:
+                entry["peer_group"] = self._percentile(int(cluster), j, value)
+            result[group] = entry
+        return result
+
+    def importances(self, top=None):
+        """Features ranked by mean absolute SHAP value, plus the feature-group totals."""
+        mean_abs = self.manifest["mean_abs_shap"]
+        mean = self.manifest["mean_shap"]
+        order = sorted(range(len(mean_abs)), key=lambda i: -mean_abs[i])[:top]
+        return {
+            "n_rows": self.manifest["n_rows"],
+            "features": [{"feature": self.feature_names[i], "mean_abs_shap": round(mean_abs[i], 6),
+                          "mean_shap": round(mean[i], 6)} for i in order],
+            "groups": {group: round(sum(mean_abs[i] for i in cols), 6) for group, cols in self.group_columns.items()},
+        }
+
+    def _percentile(self, key, group, value):
+        values = self._sorted[key][:, group]
+        return round(100.0 * np.searchsorted(values, value, side="right") / max(len(values), 1), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute SHAP values for the reference dataset.")
+    parser.add_argument("--data", default="student-combined-final.csv", help="semicolon-separated reference CSV")
+    parser.add_argument("--artifacts", default="artifacts", help="directory built by artifacts.py")
+    parser.add_argument("--model", default="student_model.joblib", help="fitted forest to explain")
+    parser.add_argument("--encoder", default="encoder.joblib", help="fitted OneHotEncoder (feature names)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per SHAP call")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--full", action="store_true", help="recompute every row instead of only new ones")
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+
+    from features import word_columns
+
+    feature_names = number_columns + list(joblib.load(args.encoder).get_feature_names_out(word_columns))
+    data = pd.read_csv(args.data, sep=';')
+    manifest = build_global_shap(data, args.artifacts, args.model, feature_names, args.chunk_size, args.workers,
+                                 args.full)
+    print(f"Explained {manifest['explained_rows']} of {manifest['n_rows']} reference rows "
+          f"in {manifest['seconds']:.2f}s into {os.path.join(args.artifacts, SHAP_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Stage latency histograms and counters, rendered in Prometheus text format.
+
+Code on the hot path wraps each stage in ``with stage("name"):``. When
+metrics are disabled and no per-request breakdown is being collected, that
+returns a shared no-op context manager, so the cost is one attribute check.
+"""
+import bisect
+import threading
+import time
+
+# Upper bounds (seconds) of the stage and request latency histograms
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the batch size histogram
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+METRIC_PREFIX = "student_risk"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """``(cumulative bucket counts including +Inf, sum, count)``."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class _StageTimer:
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.record_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms, request/error counters and batch sizes."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.requests = {}
+        self.errors = {}
+        self.request_seconds = {}
+        self.batch_sizes = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name):
+        """Context manager timing one stage (no-op when nothing would record it)."""
+        if not self.enabled and getattr(self._local, "breakdown", None) is None:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def record_stage(self, name, seconds):
+        breakdown = getattr(self._local, "breakdown", None)
+        if breakdown is not None:
+            breakdown.append((name, seconds))
+        if self.enabled:
+            self._histogram(self.stages, name, LATENCY_BUCKETS).observe(seconds)
+
+    def start_breakdown(self):
+        """Start collecting this thread's stage timings for one request."""
+        self._local.breakdown = []
+
+    def finish_breakdown(self):
+        """Stop collecting and return this thread's ``[(stage, seconds)]``."""
+        breakdown = getattr(self._local, "breakdown", None)
+        self._local.breakdown = None
+        return breakdown or []
+
+    def record_request(self, endpoint, status, seconds):
+        if not self.enabled:
+            return
+        key = (endpoint, str(status))
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        self._histogram(self.request_seconds, endpoint, LATENCY_BUCKETS).observe(seconds)
+
+    def record_batch(self, kind, size):
+        if self.enabled:
+            self._histogram(self.batch_sizes, kind, BATCH_BUCKETS).observe(size)
+
+    def render(self, extra=()):
+        """Prometheus text exposition of every metric.
+
+        ``extra`` holds ``(name, type, help, {label_tuple: value})`` entries
+        for counters and gauges owned by other components.
+        """
+        lines = []
+        self._render_histograms(lines, "stage_duration_seconds", "Duration of each prediction stage",
+                                "stage", self.stages)
+        self._render_histograms(lines, "request_duration_seconds", "HTTP request duration",
+                                "endpoint", self.request_seconds)
+        self._render_histograms(lines, "batch_size", "Students scored per vectorized call", "kind",
+                                self.batch_sizes)
+        with self._lock:
+            requests = {(("endpoint", e), ("status", s)): v for (e, s), v in self.requests.items()}
+            errors = {(("endpoint", e),): v for e, v in self.errors.items()}
+        entries = [("requests_total", "counter", "HTTP requests by endpoint and status", requests),
+                   ("errors_total", "counter", "HTTP responses with status >= 400", errors)]
+        for name, kind, help_text, values in entries + list(extra):
+            full = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in values.items():
+                lines.append(f"{full}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _histogram(self, family, key, buckets):
+        histogram = family.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = family.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def _render_histograms(self, lines, name, help_text, label, family):
+        full = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} histogram")
+        for key, histogram in sorted(family.items()):
+            cumulative, total, count = histogram.snapshot()
+            bounds = [f"{b:g}" for b in histogram.buckets] + ["+Inf"]
+            for bound, value in zip(bounds, cumulative):
+                lines.append(f"{full}_bucket{_labels(((label, key), ('le', bound)))} {value}")
+            lines.append(f"{full}_sum{_labels(((label, key),))} {total}")
+            lines.append(f"{full}_count{_labels(((label, key),))} {count}")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+# Shared registry for the process; app.py sets ``enabled`` from METRICS
+registry = MetricsRegistry()
+stage = registry.stage
@@ -0,0 +1,104 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised by ``MicroBatcher.submit`` when the request queue is at capacity."""
+
+
+class MicroBatcher:
+    """Groups concurrently submitted items into batches for one vectorized call.
+
+    Request threads ``submit`` an item and wait on the returned Future. A
+    scheduler thread takes the first waiting item, keeps collecting until
+    ``max_batch_size`` items are gathered or ``max_wait_ms`` has passed, then
+    calls ``process_batch(items)``, which must return one result per item in
+    order. While a batch is being computed new requests queue up, so batches
+    grow with load. ``submit`` raises QueueFullError rather than blocking
+    once ``max_queue`` items are waiting.
+    """
+
+    def __init__(self, process_batch, max_batch_size=64, max_wait_ms=5.0, max_queue=1024):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue ``item`` and return a Future resolved with its result."""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(f"Request queue is full ({self._queue.maxsize} waiting)") from None
+        return future
+
+    def close(self):
+        """Finish queued items and stop the scheduler thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((None, None))
+        self._thread.join()
+
+    def stats(self):
+        """Batch counters since start-up."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+            "queued": self._queue.qsize(),
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item, future = self._queue.get()
+            if future is None:
+                break
+            batch, deadline = [(item, future)], time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item, future = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if future is None:
+                    stopping = True
+                    break
+                batch.append((item, future))
+            self._execute(batch)
+
+    def _execute(self, batch):
+        running = [(item, f) for item, f in batch if f.set_running_or_notify_cancel()]
+        if not running:
+            return
+        items = [item for item, _ in running]
+        futures = [f for _, f in running]
+        try:
+            results = self.process_batch(items)
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(items)} failed: {str(e)}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(items)
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -1,67 +1,40 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.cluster import KMeans
-import shap
 import joblib
-import sqlite3
 
-model = joblib.load("student_model.joblib")
-scaler = joblib.load("scaler.joblib")
-encoder = joblib.load("encoder.joblib")
+from artifacts import load_or_fit_reference
+from features import add_new_columns, number_columns, training_absence_mean, word_columns
+from peer_index import PeerIndex
+from prediction_store import new_prediction_id, save_predictions
+from shap_explainer import SharedExplainer, top_interaction_pair
 
-data_path = "student-combined-final.csv"
-data = pd.read_csv(data_path, sep=';')
+# Loaded by load_models() on first use, so importing this module stays cheap
+model = scaler = encoder = explainer = reference = peer_index = None
 
-number_columns = [
-    "age", "Medu", "Fedu", "traveltime", "studytime", "failures",
-    "famrel", "freetime", "goout", "Dalc", "Walc", "health", "absences",
-    "G1", "G2", "study_effort", "alcohol_index", "parents_education",
-    "grade_change", "high_absences"
-]
-word_columns = [
-    "school", "sex", "famsize", "Pstatus", "Mjob", "Fjob", "reason",
-    "guardian", "schoolsup", "famsup", "paid", "activities", "nursery",
-    "higher", "internet", "romantic"
-]
-
-def add_new_columns(data):
-    if 'G3' in data.columns:
-        data["final_grade"] = (data["G1"] + data["G2"] + data["G3"]) / 3
-        data["final_grade"] = data["final_grade"].round(2)
-    else:
-        data['final_grade'] = np.nan
-    data["alcohol_index"] = data["Dalc"] + data["Walc"]
-    data["parents_education"] = data["Medu"] + data["Fedu"]
-    data["grade_change"] = data["G2"] - data["G1"]
-    avg_absences = data["absences"].mean()
-    data["high_absences"] = data["absences"].apply(lambda x: 1 if x > avg_absences else 0)
-    data["study_effort"] = data["studytime"] * (5 - data["traveltime"])
-    return data
-
-data = add_new_columns(data)
-
-X_scaled = scaler.transform(data[number_columns])
-clusters = KMeans(n_clusters=3, random_state=42).fit_predict(X_scaled)
-data["cluster"] = clusters
+def load_models(artifacts_dir="artifacts", data_path="student-combined-final.csv"):
+    """Load the model files and peer groups once."""
+    global model, scaler, encoder, explainer, reference, peer_index
+    if model is not None:
+        return
+    scaler = joblib.load("scaler.joblib")
+    encoder = joblib.load("encoder.joblib")
+    reference = load_or_fit_reference(artifacts_dir, data_path, scaler, scaler_path="scaler.joblib")
+    peer_index = PeerIndex.from_reference(reference)
+    explainer = SharedExplainer(joblib.load("student_model.joblib"))
+    model = explainer.model
 
 def process_user_data(user_input):
+    load_models()
     user_df = pd.DataFrame([user_input])
-    user_df = add_new_columns(user_df)
+    # high_absences compares against the training-set mean, as in the service
+    user_df = add_new_columns(user_df, training_absence_mean(scaler))
     user_numbers = scaler.transform(user_df[number_columns])
     user_words = encoder.transform(user_df[word_columns])
     user_ready = np.hstack((user_numbers, user_words))
     risk_prob = model.predict_proba(user_ready)[0][1]
     at_risk = model.predict(user_ready)[0]
-    explainer = shap.TreeExplainer(model)
-    shap_values = explainer.shap_values(user_ready)
-    if isinstance(shap_values, list) and len(shap_values) > 1:
-        shap_values_class = shap_values[1]
-    else:
-        shap_values_class = shap_values[0] if isinstance(shap_values, list) else shap_values
+    shap_values_class = explainer.shap_values(user_ready)[0]
     feature_names = number_columns + list(encoder.get_feature_names_out(word_columns))
-    shap_values_class = np.ravel(shap_values_class)
     shap_contributions = {k: float(v) for k, v in zip(feature_names, shap_values_class)}
     insights = {}
     base_threshold = 0.5
@@ -69,22 +42,14 @@ def process_user_data(user_input):
     dynamic_threshold = min(base_threshold + threshold_adjust, 1.0)
     risk_label = "High" if risk_prob > dynamic_threshold else "Low" if risk_prob < 0.3 else "Medium"
     insights["dynamic_risk"] = {"probability": f"{risk_prob:.2f}", "label": risk_label, "threshold": f"{dynamic_threshold:.2f}"}
-    shap_interactions = explainer.shap_interaction_values(user_ready)
-    if isinstance(shap_interactions, list) and len(shap_interactions) > 1:
-        shap_interactions_class = shap_interactions[1]
-    else:
-        shap_interactions_class = shap_interactions[0] if isinstance(shap_interactions, list) else shap_interactions
+    shap_interactions_class = explainer.shap_interaction_values(user_ready)[0]
     if shap_interactions_class.ndim == 2 and shap_interactions_class.shape[0] > 1:
-        top_interaction_idx = np.argmax(np.abs(shap_interactions_class))
-        feature1, feature2 = np.unravel_index(top_interaction_idx, shap_interactions_class.shape)
-        interaction_value = float(shap_interactions_class[feature1, feature2])
+        feature1, feature2, interaction_value = top_interaction_pair(shap_interactions_class)
         insights["top_interaction"] = f"{feature_names[feature1]} + {feature_names[feature2]}: {interaction_value:.2f}"
     else:
         insights["top_interaction"] = "No significant interactions detected"
-    user_cluster = clusters[np.argmin(np.sum((X_scaled - user_numbers)**2, axis=1))]
-    peer_avg = data[data["cluster"] == user_cluster][["studytime", "absences", "G1"]].mean()
-    if peer_avg.isna().any():
-        peer_avg = pd.Series({"studytime": 0, "absences": 0, "G1": 0})
+    user_cluster = peer_index.assign(user_numbers)[0]
+    peer_avg = peer_index.peer_means(user_cluster, ["studytime", "absences", "G1"])
     insights["peer_benchmark"] = {
         "studytime": f"Yours: {user_df['studytime'].iloc[0]} vs. Peer Avg: {peer_avg['studytime']:.1f}",
         "absences": f"Yours: {user_df['absences'].iloc[0]} vs. Peer Avg: {peer_avg['absences']:.1f}",
@@ -96,7 +61,7 @@ def process_user_data(user_input):
         if feature in ["studytime", "traveltime"]:
             mod_df["study_effort"] = mod_df["studytime"] * (5 - mod_df["traveltime"])
         elif feature == "absences":
-            avg_absences = data["absences"].mean()
+            avg_absences = training_absence_mean(scaler)
             mod_df["high_absences"] = mod_df["absences"].apply(lambda x: 1 if x > avg_absences else 0)
         elif feature in ["Dalc", "Walc"]:
             mod_df["alcohol_index"] = mod_df["Dalc"] + mod_df["Walc"]
@@ -147,11 +112,11 @@ def process_user_data(user_input):
         "Portuguese": f"{max(0, risk_prob - 0.1):.2f}"
     }
     anomalies = []
-    if user_df["G1"].iloc[0] > 12 and user_df["absences"].iloc[0] > data["absences"].mean():
+    if user_df["G1"].iloc[0] > 12 and user_df["absences"].iloc[0] > reference.absence_mean:
         anomalies.append("High grades but rising absences")
     insights["anomalies"] = anomalies if anomalies else ["No unusual patterns"]
     result = {
-        "student_id": int(pd.Timestamp.now().timestamp()),
+        "student_id": new_prediction_id(),
         "risk_probability": float(risk_prob),
         "at_risk": int(at_risk),
         "final_grade": float(user_df["final_grade"].iloc[0]) if "G3" in user_df and not pd.isna(user_df["final_grade"].iloc[0]) else None,
@@ -215,22 +180,10 @@ Student Information
     return output.strip()
 
 def save_to_database(result):
-    conn = sqlite3.connect("student_features.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_predictions (
-            student_id INTEGER PRIMARY KEY, risk_probability REAL, at_risk INTEGER,
-            final_grade REAL, alcohol_index INTEGER
-        )
-    ''')
-    cursor.execute('''
-        INSERT OR REPLACE INTO user_predictions (student_id, risk_probability, at_risk, final_grade, alcohol_index)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (result["student_id"], result["risk_probability"], result["at_risk"], result["final_grade"], result["alcohol_index"]))
-    conn.commit()
-    conn.close()
+    save_predictions([result], "student_features.db")
 
-user_input = {
+# Example student used by the command-line demo
+EXAMPLE_STUDENT = {
     "school": "GP", "sex": "F", "age": 17, "famsize": "GT3", "Pstatus": "T",
     "Medu": 2, "Fedu": 2, "Mjob": "services", "Fjob": "services", "reason": "course",
     "guardian": "mother", "traveltime": 2, "studytime": 2, "failures": 0,
@@ -240,7 +193,10 @@ user_input = {
     "absences": 10, "G1": 12, "G2": 10
 }
 
-result = process_user_data(user_input)
-save_to_database(result)
-formatted_output = format_output(result)
-print(formatted_output)
\ No newline at end of file
+def main():
+    result = process_user_data(EXAMPLE_STUDENT)
+    save_to_database(result)
+    print(format_output(result))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Reference columns summarised for every peer group (missing ones are skipped)
+PEER_METRICS = [
+    "studytime", "absences", "G1", "G2", "G3", "failures", "goout",
+    "alcohol_index", "parents_education", "final_grade", "at_risk"
+]
+
+# How a student is placed in a peer group: the nearest KMeans centroid, or the
+# cluster of the nearest reference row (the original full-scan semantics)
+ASSIGNMENT_MODES = ("centroid", "nearest_row")
+
+
+def cluster_statistics(data, labels, n_clusters):
+    """Per-cluster count, mean and standard deviation of the peer metrics.
+
+    Returns a DataFrame indexed by cluster id with a ``count`` column and
+    ``<metric>_mean`` / ``<metric>_std`` columns; empty clusters are zero-filled.
+    """
+    import pandas as pd
+
+    metrics = [m for m in PEER_METRICS if m in data.columns]
+    grouped = data[metrics].groupby(np.asarray(labels))
+    stats = pd.concat([grouped.mean().add_suffix("_mean"), grouped.std(ddof=0).add_suffix("_std")], axis=1)
+    stats.insert(0, "count", grouped.size())
+    return stats.reindex(range(n_clusters)).fillna(0)
+
+
+class PeerIndex:
+    """Fitted peer groups with a precomputed statistics table.
+
+    Assignment costs O(n_clusters) per student in ``centroid`` mode instead of
+    a scan over every reference row, and peer averages are table lookups.
+    ``stats`` may be None when only ``assign`` is needed.
+    """
+
+    def __init__(self, centroids, labels, stats, X_reference=None, assignment="centroid"):
+        if assignment not in ASSIGNMENT_MODES:
+            raise ValueError(f"assignment must be one of {list(ASSIGNMENT_MODES)}")
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.labels = np.asarray(labels)
+        self.stats = stats
+        self.assignment = assignment
+        self._tree = None
+        if assignment == "nearest_row":
+            from sklearn.neighbors import KDTree
+            self._tree = KDTree(X_reference)
+
+    @classmethod
+    def from_reference(cls, reference, assignment="centroid"):
+        """Build the index from fitted or loaded ``artifacts.ReferenceArtifacts``."""
+        return cls(reference.centroids, reference.labels, reference.stats, reference.X_scaled, assignment)
+
+    def assign(self, user_numbers):
+        """Return the peer cluster of every row of a scaled numeric matrix."""
+        user_numbers = np.atleast_2d(user_numbers)
+        if self._tree is not None:
+            nearest = self._tree.query(user_numbers, k=1, return_distance=False)[:, 0]
+            return self.labels[nearest]
+        distances = ((user_numbers[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        return np.argmin(distances, axis=1)
+
+    def peer_stats(self, cluster):
+        """Return the statistics row of one cluster as a dict."""
+        return self.stats.loc[int(cluster)].to_dict()
+
+    def peer_means(self, cluster, metrics):
+        """Return ``{metric: mean}`` for one cluster."""
+        row = self.stats.loc[int(cluster)]
+        return {m: float(row[f"{m}_mean"]) for m in metrics}
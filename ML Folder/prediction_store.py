@@ -0,0 +1,289 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "student_features.db"
+
+# Columns of user_predictions; tables created by older versions get the
+# missing ones added on first connection
+PREDICTION_COLUMNS = {
+    "student_id": "INTEGER PRIMARY KEY",
+    "risk_probability": "REAL",
+    "at_risk": "INTEGER",
+    "final_grade": "REAL",
+    "alcohol_index": "INTEGER",
+    "insights": "TEXT",
+    "created_at": "REAL",
+}
+
+# What a stored prediction passes to the rollup and listeners: ``key`` is
+# response_cache.student_key of the input, so repeat views of one student can
+# be recognised; ``shap`` is the class-1 SHAP vector the request computed, or
+# None (not explained, or served from the response cache)
+Observation = namedtuple("Observation", ["key", "record", "result", "shap"])
+
+# Plain INSERT: a duplicate student_id is an error, never a silent overwrite
+INSERT_SQL = (
+    f"INSERT INTO user_predictions ({', '.join(PREDICTION_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in PREDICTION_COLUMNS)})"
+)
+
+# Prediction ids are (block << ID_BLOCK_BITS) | sequence. Each process reserves
+# a block by inserting into prediction_id_blocks of the database it writes to,
+# so SQLite assigns it and no two processes (or forked workers) ever hand out
+# the same id. Blocks are numbered in reservation order, starting above the
+# largest stored id so they never meet ids written by older versions
+ID_BLOCK_BITS = 20
+
+_RESERVE_SQL = (
+    "INSERT INTO prediction_id_blocks (block, pid, created_at) SELECT MAX("
+    " (SELECT COALESCE(MAX(block), 0) FROM prediction_id_blocks) + 1,"
+    f" ((SELECT COALESCE(MAX(student_id), 0) FROM user_predictions) >> {ID_BLOCK_BITS}) + 1), ?, ?"
+)
+
+
+class IdAllocator:
+    """Hands out unique integer ids from blocks reserved in ``db_path``.
+
+    With ``db_path=None`` nothing is written and blocks are numbered in
+    memory, so ids are only unique within the process; use it for
+    predictions that are never stored.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+        self._local_blocks = 0
+
+    def next_id(self):
+        with self._lock:
+            # A forked child must not continue its parent's block
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._reserve()
+            self._next += 1
+            return self._next - 1
+
+    def _reserve(self):
+        if self.db_path is None:
+            self._local_blocks += 1
+            block = self._local_blocks
+        else:
+            conn = connect(self.db_path)
+            try:
+                with conn:
+                    block = conn.execute(_RESERVE_SQL, (os.getpid(), time.time())).lastrowid
+            finally:
+                conn.close()
+        self._pid = os.getpid()
+        self._next, self._end = block << ID_BLOCK_BITS, (block + 1) << ID_BLOCK_BITS
+
+
+_id_allocator = IdAllocator()
+
+
+def new_prediction_id():
+    """Return an integer id for a prediction that is unique across processes sharing ``DB_PATH``.
+
+    The first call reserves a block in ``DB_PATH``; callers storing elsewhere
+    (or not at all) use their own ``IdAllocator``.
+    """
+    return _id_allocator.next_id()
+
+
+def connect(db_path=DB_PATH):
+    """Open a connection in WAL mode and make sure the predictions table is current."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    columns = ", ".join(f"{name} {kind}" for name, kind in PREDICTION_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS user_predictions ({columns})")
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(user_predictions)")}
+    for name, kind in PREDICTION_COLUMNS.items():
+        if name not in existing:
+            try:
+                conn.execute(f"ALTER TABLE user_predictions ADD COLUMN {name} {kind}")
+            except sqlite3.OperationalError as e:
+                # Another connection migrated the table first
+                if "duplicate column" not in str(e):
+                    raise
+    conn.execute("CREATE TABLE IF NOT EXISTS prediction_id_blocks "
+                 "(block INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, created_at REAL)")
+    conn.commit()
+    return conn
+
+
+def prediction_row(result, created_at=None):
+    """Map a process_user_data result to a user_predictions row."""
+    return (
+        result["student_id"], result["risk_probability"], result["at_risk"],
+        result["final_grade"], result["alcohol_index"], json.dumps(result["insights"]),
+        time.time() if created_at is None else created_at,
+    )
+
+
+def unique_rows(conn, rows):
+    """Drop (and log) ``(row, observation)`` pairs whose id is already stored or repeated earlier."""
+    kept, seen = [], set()
+    for row, observation in rows:
+        student_id = row[0]
+        if student_id in seen or conn.execute("SELECT 1 FROM user_predictions WHERE student_id = ?",
+                                              (student_id,)).fetchone():
+            logger.error(f"Duplicate prediction id {student_id}; prediction not written")
+        else:
+            seen.add(student_id)
+            kept.append((row, observation))
+    return kept
+
+
+def save_predictions(results, db_path=DB_PATH):
+    """Synchronously insert results in one transaction (for scripts and batch jobs).
+
+    Rows with an id that is already stored are logged and skipped, as in
+    ``PredictionStore``; returns the number of rows written.
+    """
+    rows = [(prediction_row(r), None) for r in results]
+    conn = connect(db_path)
+    try:
+        try:
+            with conn:
+                conn.executemany(INSERT_SQL, [row for row, _ in rows])
+        except sqlite3.IntegrityError:
+            rows = unique_rows(conn, rows)
+            with conn:
+                conn.executemany(INSERT_SQL, [row for row, _ in rows])
+    finally:
+        conn.close()
+    return len(rows)
+
+
+class PredictionStore:
+    """Background writer that batches prediction inserts into few transactions.
+
+    ``submit`` never blocks the caller: rows go onto a bounded queue and a
+    daemon thread, owning one long-lived WAL connection, writes them with
+    ``executemany`` once ``batch_size`` rows are waiting or ``flush_interval``
+    seconds have passed. Rows are dropped (and counted) if the queue is full;
+    a row whose id is already stored is logged, counted and skipped.
+
+    ``listeners`` are called on the writer thread with the list of
+    observations passed to ``submit`` once their rows are committed.
+    ``rollup(conn, observations)``, if set, runs inside the insert
+    transaction so derived tables commit together with the rows; if it
+    fails only its own changes are rolled back.
+    """
+
+    def __init__(self, db_path=DB_PATH, batch_size=256, flush_interval=0.5, max_queue=10000, listeners=(),
+                 rollup=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.listeners = list(listeners)
+        self.rollup = rollup
+        self.dropped = 0
+        self.duplicates = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="prediction-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, result, observation=None):
+        """Queue one result for writing; returns False if it had to be dropped."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait((prediction_row(result), observation))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Prediction store queue full; dropped prediction %s", result["student_id"])
+            return False
+
+    def flush(self):
+        """Block until every queued row has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Flush pending rows and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch, deadline = [], time.monotonic() + self.flush_interval
+                item = first
+                while True:
+                    if item is None:
+                        stopping = True
+                    else:
+                        batch.append(item)
+                    if stopping or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                self._write(conn, batch)
+                for _ in range(len(batch) + (1 if stopping else 0)):
+                    self._queue.task_done()
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        if not batch:
+            return
+        try:
+            try:
+                self._commit(conn, batch)
+            except sqlite3.IntegrityError:
+                kept = unique_rows(conn, batch)
+                self.duplicates += len(batch) - len(kept)
+                batch = kept
+                self._commit(conn, batch)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(batch)} predictions: {str(e)}")
+            return
+        observations = [observation for _, observation in batch if observation is not None]
+        for listener in self.listeners if observations else ():
+            try:
+                listener(observations)
+            except Exception as e:
+                logger.error(f"Prediction listener failed: {str(e)}")
+
+    def _commit(self, conn, batch):
+        observations = [observation for _, observation in batch if observation is not None]
+        with conn:
+            conn.executemany(INSERT_SQL, [row for row, _ in batch])
+            if self.rollup is not None and observations:
+                self._apply_rollup(conn, observations)
+        self.written += len(batch)
+
+    def _apply_rollup(self, conn, observations):
+        conn.execute("SAVEPOINT rollup")
+        try:
+            self.rollup(conn, observations)
+        except Exception as e:
+            conn.execute("ROLLBACK TO rollup")
+            logger.error(f"Prediction rollup failed: {str(e)}")
+        conn.execute("RELEASE rollup")
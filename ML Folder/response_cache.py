@@ -0,0 +1,212 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from artifacts import file_sha256
+from features import input_number_columns, word_columns
+
+# Cache backends selectable with RESPONSE_CACHE ("off" disables caching)
+CACHE_BACKENDS = ("memory", "sqlite", "off")
+
+# Optional input fields that change the response when present
+OPTIONAL_FIELDS = ("G3",)
+
+
+def model_version(paths, extra=()):
+    """Short version string derived from the contents of the model artifacts.
+
+    Any change to one of ``paths`` (or to an ``extra`` string such as the
+    reference artifact checksum) yields a new version and so new cache keys.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(file_sha256(path).encode())
+    for value in extra:
+        digest.update(str(value).encode())
+    return digest.hexdigest()[:16]
+
+
+def canonical_fields(user_input):
+    """The validated input fields the model reads, normalised for hashing.
+
+    Numbers become floats so ``3`` and ``3.0`` compare equal; other fields
+    are ignored.
+    """
+    fields = {col: float(user_input[col]) for col in input_number_columns}
+    fields.update({col: str(user_input[col]) for col in word_columns})
+    for col in OPTIONAL_FIELDS:
+        value = user_input.get(col)
+        if value is not None and value == value:  # skip None and NaN
+            fields[col] = float(value)
+    return fields
+
+
+def canonical_key(user_input, depth, top_k, version):
+    """Hash of the canonical input fields, explanation options and model version."""
+    payload = json.dumps([canonical_fields(user_input), depth, top_k or 0, version], sort_keys=True,
+                         separators=(",", ":"))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def student_key(user_input):
+    """Hash of the canonical input fields alone; repeat views of a student share it."""
+    payload = json.dumps(canonical_fields(user_input), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU of serialized responses bounded by total bytes, with a TTL."""
+
+    def __init__(self, max_bytes=64 << 20, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def info(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+
+class SQLiteCacheBackend:
+    """Response cache in a local SQLite file, shared by every worker process on a host."""
+
+    def __init__(self, db_path="response_cache.db", max_bytes=64 << 20, ttl=3600):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                return None
+            self._conn.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (now, key))
+            return bytes(row[0])
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + self.ttl, now),
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # Drop expired entries first, then least recently used ones
+            evicted = self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            for old_key, size in self._conn.execute(
+                "SELECT key, size FROM response_cache ORDER BY last_used"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (old_key,))
+                total -= size
+                evicted += 1
+            self.evictions += evicted
+
+    def info(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache"
+            ).fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "path": self.db_path}
+
+
+class ResponseCache:
+    """Caches full prediction responses keyed by ``canonical_key``.
+
+    Responses are stored as JSON, so any backend with ``get(key)``,
+    ``set(key, value)``, ``info()`` and an ``evictions`` counter can be
+    plugged in. ``student_id`` is not cached; callers assign a fresh one.
+    """
+
+    def __init__(self, backend, version):
+        self.backend = backend
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, user_input, depth, top_k):
+        return canonical_key(user_input, depth, top_k, self.version)
+
+    def get(self, key):
+        """Cached response for ``key`` (without ``student_id``), or None."""
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def put(self, key, result):
+        response = {k: v for k, v in result.items() if k != "student_id"}
+        self.backend.set(key, json.dumps(response, separators=(",", ":")).encode())
+
+    def stats(self):
+        """Hit/miss/eviction counters and backend size for this process."""
+        lookups = self.hits + self.misses
+        return dict(
+            self.backend.info(),
+            version=self.version,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.backend.evictions,
+            hit_rate=round(self.hits / lookups, 4) if lookups else 0.0,
+        )
@@ -0,0 +1,129 @@
+import itertools
+import math
+
+import numpy as np
+
+from features import input_number_columns, number_columns
+
+# Derived columns and the raw inputs they depend on; a derived column is
+# recomputed in a scenario whenever one of its inputs is perturbed
+DERIVED_RULES = {
+    "study_effort": (("studytime", "traveltime"), lambda c, absence_mean: c["studytime"] * (5 - c["traveltime"])),
+    "alcohol_index": (("Dalc", "Walc"), lambda c, absence_mean: c["Dalc"] + c["Walc"]),
+    "parents_education": (("Medu", "Fedu"), lambda c, absence_mean: c["Medu"] + c["Fedu"]),
+    "grade_change": (("G1", "G2"), lambda c, absence_mean: c["G2"] - c["G1"]),
+    "high_absences": (("absences",), lambda c, absence_mean: (c["absences"] > absence_mean).astype(np.float64)),
+}
+
+# Scenarios reported in every /predict response (what_if and interventions)
+STANDARD_SCENARIOS = {
+    "study_plus_1": {"studytime": {"delta": 1}},
+    "absences_minus_5": {"absences": {"delta": -5, "min": 0}},
+}
+
+# Upper bound on scenarios evaluated for one student in a single request
+MAX_SCENARIOS = 10000
+
+
+def validate_scenario(changes):
+    """Raise ValueError unless ``changes`` maps raw numeric fields to a value or delta spec.
+
+    A change is either an absolute number or ``{"delta": k, "min": lo, "max": hi}``
+    (bounds optional).
+    """
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("Each scenario must be a non-empty object of feature changes")
+    for feature, change in changes.items():
+        if feature not in input_number_columns:
+            raise ValueError(f"Cannot perturb {feature}; choose from {input_number_columns}")
+        if isinstance(change, dict):
+            values = [change.get("delta"), change.get("min", 0), change.get("max", 0)]
+        else:
+            values = [change]
+        if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in values):
+            raise ValueError(f"Change for {feature} must be a number or a delta spec")
+
+
+def grid_size(grid):
+    """Number of scenarios ``grid_scenarios`` would produce, without expanding the grid.
+
+    Raises ValueError unless ``grid`` maps features to non-empty lists of values.
+    """
+    if not isinstance(grid, dict):
+        raise ValueError("grid must be an object of feature value lists")
+    for feature, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Grid values for {feature} must be a non-empty list")
+    return math.prod(len(values) for values in grid.values())
+
+
+def grid_scenarios(grid):
+    """Expand ``{feature: [values...]}`` into the cartesian product of absolute scenarios.
+
+    Check ``grid_size`` against ``MAX_SCENARIOS`` first; the product grows
+    exponentially with the number of features.
+    """
+    features = list(grid)
+    return [dict(zip(features, combo)) for combo in itertools.product(*(grid[f] for f in features))]
+
+
+class ScenarioEngine:
+    """Evaluates feature perturbations for many students with one model call.
+
+    ``mean`` and ``scale`` are the fitted scaler's parameters (as held by
+    ``CompiledFeatureEncoder``). ``risk_fn`` maps a model-ready matrix to
+    class-1 probabilities, so the engine scores with whichever inference
+    backend the service uses.
+    """
+
+    def __init__(self, mean, scale, risk_fn, absence_mean):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.risk_fn = risk_fn
+        self.absence_mean = absence_mean
+        self._index = {col: i for i, col in enumerate(number_columns)}
+
+    def perturb(self, base_numbers, scenarios):
+        """Apply every scenario to every engineered (unscaled) row.
+
+        Returns an ``(n_rows * n_scenarios, n_numeric)`` matrix ordered row-major
+        by student, then scenario.
+        """
+        n_rows, n_scenarios = len(base_numbers), len(scenarios)
+        perturbed = np.repeat(np.asarray(base_numbers, dtype=np.float64)[:, None, :], n_scenarios, axis=1)
+        for s, changes in enumerate(scenarios):
+            block = perturbed[:, s, :]
+            for feature, change in changes.items():
+                col = self._index[feature]
+                if isinstance(change, dict):
+                    values = block[:, col] + change["delta"]
+                    if "min" in change:
+                        values = np.maximum(values, change["min"])
+                    if "max" in change:
+                        values = np.minimum(values, change["max"])
+                else:
+                    values = np.full(n_rows, float(change))
+                block[:, col] = values
+            columns = {name: block[:, i] for name, i in self._index.items()}
+            for derived, (inputs, rule) in DERIVED_RULES.items():
+                if any(f in changes for f in inputs):
+                    block[:, self._index[derived]] = rule(columns, self.absence_mean)
+        return perturbed.reshape(n_rows * n_scenarios, -1)
+
+    def evaluate(self, base_numbers, base_words, scenarios):
+        """Risk probability of every student under every scenario, as ``(n_rows, n_scenarios)``.
+
+        Identical perturbed rows (duplicate scenarios, or changes clipped back to
+        the current value) are scored once.
+        """
+        n_rows, n_scenarios = len(base_numbers), len(scenarios)
+        if n_rows == 0 or n_scenarios == 0:
+            return np.empty((n_rows, n_scenarios))
+        numbers = self.perturb(base_numbers, scenarios)
+        words = np.repeat(np.asarray(base_words, dtype=np.float64), n_scenarios, axis=0)
+        unique_rows, inverse = np.unique(np.hstack((numbers, words)), axis=0, return_inverse=True)
+        n_numeric = numbers.shape[1]
+        scaled = (unique_rows[:, :n_numeric] - self.mean) / self.scale
+        ready = np.hstack((scaled, unique_rows[:, n_numeric:]))
+        probs = np.asarray(self.risk_fn(ready))[inverse.ravel()]
+        return probs.reshape(n_rows, n_scenarios)
@@ -0,0 +1,55 @@
+"""Core risk scoring that needs only NumPy and the exported artifacts.
+
+``python artifacts.py`` writes the compiled forest, the encoder parameters
+and the peer-group centroids; loading them here does not import sklearn,
+pandas, joblib or shap, so a scoring process starts in well under a second:
+
+    from scoring import Scorer
+    scorer = Scorer.load("artifacts")
+    risk, at_risk, cluster = scorer.score([student])
+
+The Flask app and the analysis scripts add explanations, what-ifs and
+insights on top and load the heavier libraries themselves.
+"""
+import os
+
+import numpy as np
+
+from artifacts import ARRAY_FILES, ENCODER_FILE, FOREST_DIR
+from compiled_forest import CompiledForest
+from feature_encoder import CompiledFeatureEncoder
+from features import number_columns
+from peer_index import PeerIndex
+
+
+class Scorer:
+    """Encoder, compiled forest and peer centroids for scoring raw student dicts."""
+
+    def __init__(self, encoder, forest, peer_index):
+        self.encoder = encoder
+        self.forest = forest
+        self.peer_index = peer_index
+
+    @classmethod
+    def load(cls, artifacts_dir="artifacts", model_path=None):
+        """Memory-map the exported artifacts in ``artifacts_dir``.
+
+        Raises FileNotFoundError if they were not built (run artifacts.py) and
+        ValueError if the forest was compiled from a different ``model_path``.
+        """
+        encoder = CompiledFeatureEncoder.load(os.path.join(artifacts_dir, ENCODER_FILE))
+        forest = CompiledForest.load(os.path.join(artifacts_dir, FOREST_DIR), model_path=model_path)
+        centroids = np.load(os.path.join(artifacts_dir, ARRAY_FILES["centroids"]), mmap_mode="r")
+        labels = np.load(os.path.join(artifacts_dir, ARRAY_FILES["labels"]), mmap_mode="r")
+        return cls(encoder, forest, PeerIndex(centroids, labels, stats=None))
+
+    def score(self, records):
+        """Return ``(risk_probabilities, at_risk, peer_clusters)`` for a dict or list of dicts.
+
+        Raises ValueError for unknown categories and KeyError for missing fields.
+        """
+        _, ready = self.encoder.encode(records)
+        proba = self.forest.predict_proba(ready)
+        at_risk = self.forest.classes_[np.argmax(proba, axis=1)]
+        clusters = self.peer_index.assign(ready[:, :len(number_columns)])
+        return proba[:, 1], at_risk, clusters
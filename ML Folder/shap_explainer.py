@@ -0,0 +1,140 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import stage
+
+# Explanation depths a caller may request, cheapest first
+EXPLAIN_DEPTHS = ("none", "main", "full")
+
+
+def positive_class(values, n_rows):
+    """Select class-1 (at_risk) attributions from a TreeExplainer result.
+
+    Older SHAP releases return one array per class, newer ones append a class
+    axis; both are normalised to ``(n_rows, ...)`` for the risk class.
+    """
+    if isinstance(values, list):
+        values = values[1] if len(values) > 1 else values[0]
+    values = np.asarray(values)
+    if values.ndim in (3, 4) and values.shape[-1] == 2:
+        values = values[..., 1]
+    return values.reshape((n_rows,) + values.shape[1:])
+
+
+def top_interaction_pair(matrix, features=None):
+    """Return ``(i, j, value)`` for the largest absolute off-diagonal entry of an interaction matrix.
+
+    The diagonal holds each feature's main effect, not an interaction, so it
+    is excluded. With ``features`` only pairs among those indices are searched.
+    """
+    features = np.arange(len(matrix)) if features is None else np.asarray(features)
+    off_diagonal = np.abs(matrix[np.ix_(features, features)])
+    np.fill_diagonal(off_diagonal, 0.0)
+    a, b = np.unravel_index(np.argmax(off_diagonal), off_diagonal.shape)
+    i, j = int(features[a]), int(features[b])
+    return i, j, float(matrix[i, j])
+
+
+class SharedExplainer:
+    """A TreeExplainer built once per process and shared between request threads.
+
+    ``shap`` itself is imported when the explainer is first built.
+    """
+
+    def __init__(self, model, cache_size=2048):
+        self.model = model
+        self.cache_size = cache_size
+        self._explainer = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def get(self):
+        """Return the underlying TreeExplainer, building it on first use."""
+        if self._explainer is None:
+            with self._lock:
+                if self._explainer is None:
+                    # shap (with numba and scipy) takes seconds to import; only pay for it when explaining
+                    import shap
+
+                    with stage("explainer_init"):
+                        self._explainer = shap.TreeExplainer(self.model)
+        return self._explainer
+
+    def shap_values(self, X):
+        """Class-1 SHAP values for every row of ``X`` as an ``(n_rows, n_features)`` array."""
+        explainer = self.get()
+        with self._lock, stage("shap_values"):
+            values = explainer.shap_values(X)
+        return positive_class(values, len(X))
+
+    def shap_interaction_values(self, X):
+        """Class-1 SHAP interaction values as an ``(n_rows, n_features, n_features)`` array."""
+        explainer = self.get()
+        with self._lock, stage("shap_interaction_values"):
+            values = explainer.shap_interaction_values(X)
+        return positive_class(values, len(X))
+
+    def explain(self, X, depth="main", top_k=None):
+        """Explain each row of ``X`` at the requested depth, reusing cached results.
+
+        Returns one dict per row with ``"shap"`` (class-1 SHAP vector, or None
+        for depth ``"none"``), ``"interaction"`` (``(i, j, value)`` of the top
+        interaction, or None unless depth is ``"full"``) and
+        ``"interaction_top_k"``. The interaction values are always exact; with
+        ``top_k`` the top pair is only searched among the row's ``top_k``
+        features by absolute SHAP value, and ``"interaction_top_k"`` records
+        that k (None otherwise). Results are cached under a hash of the
+        encoded row, the depth and ``top_k``.
+        """
+        if depth not in EXPLAIN_DEPTHS:
+            raise ValueError(f"explain must be one of {list(EXPLAIN_DEPTHS)}")
+        if depth == "none":
+            return [{"shap": None, "interaction": None, "interaction_top_k": None} for _ in range(len(X))]
+
+        keys = [self._cache_key(row, depth, top_k) for row in X]
+        explanations = [self._cache_get(key) for key in keys]
+        missing = [i for i, e in enumerate(explanations) if e is None]
+        if missing:
+            X_missing = X[missing]
+            shap_matrix = self.shap_values(X_missing)
+            scope = top_k if depth == "full" and top_k else None
+            if depth != "full":
+                pairs = [None] * len(missing)
+            else:
+                top = np.argsort(-np.abs(shap_matrix), axis=1)[:, :max(scope, 2)] if scope else [None] * len(missing)
+                pairs = [top_interaction_pair(m, features)
+                         for m, features in zip(self.shap_interaction_values(X_missing), top)]
+            for row, i in enumerate(missing):
+                explanations[i] = {"shap": shap_matrix[row], "interaction": pairs[row], "interaction_top_k": scope}
+                self._cache_put(keys[i], explanations[i])
+        return explanations
+
+    def cache_info(self):
+        """Current number of cached explanations and the configured maximum."""
+        with self._cache_lock:
+            return {"size": len(self._cache), "max_size": self.cache_size}
+
+    def _cache_key(self, row, depth, top_k):
+        digest = hashlib.blake2b(np.ascontiguousarray(row, dtype=np.float64).tobytes(), digest_size=16)
+        digest.update(f"{depth}:{top_k or 0}".encode())
+        return digest.hexdigest()
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            explanation = self._cache.get(key)
+            if explanation is not None:
+                self._cache.move_to_end(key)
+            return explanation
+
+    def _cache_put(self, key, explanation):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = explanation
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)